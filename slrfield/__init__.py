@@ -12,6 +12,11 @@ Currently, operations on SLR data include:
 
 from .cpf.cpf_download import cpf_download,get_cpf_satlist
 from .slrclasses.cpfclass import CPF
+from .slrclasses.cpfephemeris import CPFEphemeris
+from .slrclasses.cpfchebyshev import CPFChebyshev
+from .slrclasses.cpftracker import CPFTracker
+from .slrclasses.timegrid import TimeGrid
+from .slrclasses.earthorientation import EarthOrientation
 from .utils import data_prepare
 
 # Load and update the EOP file and Leap Second file
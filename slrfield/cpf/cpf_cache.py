@@ -0,0 +1,197 @@
+import json
+import hashlib
+from os import path,makedirs,remove,replace,scandir,stat,utime,getpid
+from pathlib import Path
+from warnings import warn
+
+import numpy as np
+
+from ..slrclasses.cpfephemeris import CPFEphemeris
+
+# Increase the version whenever the layout of the parsed CPF data changes
+CACHE_VERSION = 3
+# Running total of the size of each cache directory in bytes, so that the directory is only scanned for the eviction when the size cap may have been crossed
+CACHE_SIZE = {}
+
+def cache_dir_default():
+    """
+    Default directory for storing the binary cache of parsed CPF ephemeris files.
+    """
+    home = str(Path.home())
+    return home + '/src/cpf_cache/'
+
+def cache_path(cpf_path,cache_dir):
+    """
+    Generate the path of the cache file for a CPF ephemeris file, which is keyed by its absolute path.
+
+    Usage:
+        dir_cache_file = cache_path('CPF/CDDIS/2020-10-02/lageos1_cpf_201002_7761.sgf','/home/user/src/cpf_cache/')
+
+    Inputs:
+        cpf_path -> [str] path of the CPF ephemeris file
+        cache_dir -> [str] directory for storing the cache files
+
+    Outputs:
+        dir_cache_file -> [str] path of the cache file
+    """
+    key = '{:s}|{:d}'.format(path.abspath(cpf_path),CACHE_VERSION)
+    return cache_dir + hashlib.sha1(key.encode()).hexdigest() + '.npz'
+
+def content_hash(cpf_data):
+    """
+    Compute the hash of the raw content of a CPF ephemeris file.
+    """
+    return hashlib.sha1(cpf_data).hexdigest()
+
+def load_cache(cpf_path,cpf_data,cache_dir=None):
+    """
+    Load the parsed data of a CPF ephemeris file from the cache.
+    The cache is valid if the size and modification time of the file are unchanged since it was cached;
+    otherwise, the content hash of the file is compared, so that files touched or downloaded again with the same content are still served from the cache.
+
+    Usage:
+        data = load_cache(cpf_path,cpf_data)
+
+    Inputs:
+        cpf_path -> [str] path of the CPF ephemeris file
+        cpf_data -> [bytes] raw content of the CPF ephemeris file
+
+    Parameters:
+        cache_dir -> [str, default = None] directory for storing the cache files. If None, '~/src/cpf_cache/' is used.
+
+    Outputs:
+        data -> [object or None] instance of class CPFEphemeris as returned by read_cpf; None if the file is not cached or the cache is outdated.
+    """
+    if cache_dir is None: cache_dir = cache_dir_default()
+    dir_cache_file = cache_path(cpf_path,cache_dir)
+    if not path.exists(dir_cache_file): return None
+
+    info = stat(cpf_path)
+    try:
+        with np.load(dir_cache_file) as cache:
+            meta = json.loads(str(cache['meta']))
+            if (meta['size'],meta['mtime']) != (info.st_size,info.st_mtime_ns):
+                if meta['hash'] != content_hash(cpf_data): return None
+            arrays = {key:cache[key] for key in cache.files if key != 'meta'}
+    except (OSError,ValueError,KeyError):
+        return None
+
+    # Mark the cache file as recently used for the eviction, which is best effort for a read-only cache
+    try:
+        utime(dir_cache_file)
+    except OSError:
+        pass
+
+    return unpack_cpf(meta,arrays)
+
+def save_cache(cpf_path,cpf_data,data,cache_dir=None,max_size=512):
+    """
+    Save the parsed data of a CPF ephemeris file to the cache, and evict the least recently used cache files if the size cap is exceeded.
+
+    Usage:
+        save_cache(cpf_path,cpf_data,data)
+
+    Inputs:
+        cpf_path -> [str] path of the CPF ephemeris file
+        cpf_data -> [bytes] raw content of the CPF ephemeris file
+        data -> [object] instance of class CPFEphemeris as returned by read_cpf
+
+    Parameters:
+        cache_dir -> [str, default = None] directory for storing the cache files. If None, '~/src/cpf_cache/' is used.
+        max_size -> [float, default = 512] size cap of the cache directory in MB
+    """
+    if cache_dir is None: cache_dir = cache_dir_default()
+    dir_cache_file = cache_path(cpf_path,cache_dir)
+
+    meta,arrays = pack_cpf(data)
+    info = stat(cpf_path)
+    meta.update({'size':info.st_size,'mtime':info.st_mtime_ns,'hash':content_hash(cpf_data)})
+
+    # Write to a temporary file first, so that concurrent readers never see a partial cache file
+    dir_tmp_file = '{:s}.{:d}.tmp'.format(dir_cache_file,getpid())
+    try:
+        if not path.exists(cache_dir): makedirs(cache_dir)
+        with open(dir_tmp_file,'wb') as f:
+            np.savez(f,meta=json.dumps(meta),**arrays)
+        replace(dir_tmp_file,dir_cache_file)
+        size = stat(dir_cache_file).st_size
+    except OSError as e:
+        warn('Failed to cache the parsed CPF ephemeris file {:s}: {:s}'.format(cpf_path,str(e)))
+        return
+
+    # A replaced cache file is counted twice, which only brings the next scan forward
+    total = CACHE_SIZE.get(cache_dir)
+    if total is None or total + size > max_size*1024**2:
+        evict_cache(cache_dir,max_size)
+    else:
+        CACHE_SIZE[cache_dir] = total + size
+
+def pack_cpf(data):
+    """
+    Split the parsed data of a CPF ephemeris file into header information and arrays for storage or transfer between processes.
+
+    Usage:
+        meta,arrays = pack_cpf(data)
+
+    Inputs:
+        data -> [object] instance of class CPFEphemeris as returned by read_cpf
+
+    Outputs:
+        meta -> [dictionary] header information
+        arrays -> [dictionary] numerical arrays of the CPF data
+    """
+    meta = {'header':data.header}
+    arrays = {'mjd':data.mjd,'sod':data.sod,'leap_second':data.leap_second,'positions':data.positions,'velocities':data.velocities}
+    return meta,arrays
+
+def unpack_cpf(meta,arrays):
+    """
+    Rebuild the parsed data of a CPF ephemeris file from the outputs of pack_cpf.
+
+    Usage:
+        data = unpack_cpf(meta,arrays)
+
+    Inputs:
+        meta -> [dictionary] header information
+        arrays -> [dictionary] numerical arrays of the CPF data
+
+    Outputs:
+        data -> [object] instance of class CPFEphemeris
+    """
+    return CPFEphemeris(meta['header'],**arrays)
+
+def evict_cache(cache_dir=None,max_size=512):
+    """
+    Remove the least recently used cache files if the total size of the cache directory exceeds the size cap, until it is below 90% of the cap,
+    which leaves room for further cache files before the directory needs to be scanned again.
+
+    Usage:
+        evict_cache()
+        evict_cache(max_size=0) # clear the cache
+
+    Parameters:
+        cache_dir -> [str, default = None] directory for storing the cache files. If None, '~/src/cpf_cache/' is used.
+        max_size -> [float, default = 512] size cap of the cache directory in MB
+    """
+    if cache_dir is None: cache_dir = cache_dir_default()
+    if not path.exists(cache_dir): return
+
+    entries,infos = [],[]
+    for entry in scandir(cache_dir):
+        if not entry.name.endswith('.npz'): continue
+        try:
+            infos.append(entry.stat())
+            entries.append(entry)
+        except FileNotFoundError: # removed by a concurrent process
+            pass
+    total = sum(info.st_size for info in infos)
+    max_bytes = max_size*1024**2
+    if total > max_bytes:
+        for entry,info in sorted(zip(entries,infos),key=lambda x: x[1].st_mtime):
+            try:
+                remove(entry.path)
+            except FileNotFoundError:
+                pass
+            total -= info.st_size
+            if total <= 0.9*max_bytes: break
+    CACHE_SIZE[cache_dir] = total
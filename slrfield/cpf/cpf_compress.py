@@ -0,0 +1,149 @@
+import gzip
+import bz2
+import lzma
+from io import BytesIO
+
+# Leading bytes that identify the compression formats of CPF ephemeris files
+MAGIC_NUMBERS = [(b'\x1f\x8b','gzip'),(b'BZh','bz2'),(b'\xfd7zXZ\x00','xz'),(b'\x1f\x9d','lzw')]
+
+def compression_type(head):
+    """
+    Identify the compression format of a file from its leading bytes.
+
+    Usage:
+        compression = compression_type(head)
+
+    Inputs:
+        head -> [bytes] leading bytes of the file, at least 6 bytes unless the file is shorter
+
+    Outputs:
+        compression -> [str or None] 'gzip', 'bz2', 'xz' or 'lzw'(Unix compress, '.Z'); None for plain text
+    """
+    for magic,compression in MAGIC_NUMBERS:
+        if head.startswith(magic): return compression
+    return None
+
+def decompress(raw):
+    """
+    Decompress the raw content of a CPF ephemeris file in memory. Plain text is returned as is.
+
+    Usage:
+        cpf_data = decompress(raw)
+
+    Inputs:
+        raw -> [bytes] raw content of the file, either compressed or plain text
+
+    Outputs:
+        cpf_data -> [bytes] content of the CPF ephemeris file
+    """
+    compression = compression_type(raw[:6])
+    if compression == 'gzip':
+        return gzip.decompress(raw)
+    elif compression == 'bz2':
+        return bz2.decompress(raw)
+    elif compression == 'xz':
+        return lzma.decompress(raw)
+    elif compression == 'lzw':
+        return unlzw(raw)
+    return raw
+
+def open_cpf(cpf_path):
+    """
+    Open a CPF ephemeris file for reading in binary mode, decompressing it on the fly if it is compressed.
+    The compression format is detected from the content rather than the file extension.
+
+    Usage:
+        with open_cpf(cpf_path) as f:
+            for line in f: ...
+
+    Inputs:
+        cpf_path -> [str] path of the CPF ephemeris file
+
+    Outputs:
+        f -> [file object] binary file object of the decompressed content
+    """
+    f = open(cpf_path,'rb')
+    compression = compression_type(f.peek(6)[:6])
+    if compression is None: return f
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=f)
+    elif compression == 'bz2':
+        return bz2.BZ2File(f)
+    elif compression == 'xz':
+        return lzma.LZMAFile(f)
+    # There is no incremental decoder for Unix compress in the standard library
+    with f:
+        return BytesIO(unlzw(f.read()))
+
+def unlzw(raw):
+    """
+    Decompress data in the format of Unix compress('.Z' files), which is an adaptive LZW coding with code widths from 9 to 16 bits.
+
+    Usage:
+        data = unlzw(raw)
+
+    Inputs:
+        raw -> [bytes] compressed data including the 3-byte header
+
+    Outputs:
+        data -> [bytes] decompressed data
+    """
+    if len(raw) < 3 or raw[:2] != b'\x1f\x9d':
+        raise ValueError('Not in the format of Unix compress')
+    flags = raw[2]
+    if flags & 0x60:
+        raise ValueError('Unknown flags in the header of Unix compress')
+    max_bits = flags & 0x1f
+    block_mode = bool(flags & 0x80)
+    if not 9 <= max_bits <= 16:
+        raise ValueError('Invalid maximum code width in the header of Unix compress')
+
+    n = len(raw)
+    pos = 3 # byte offset of the current group of codes
+    bits,mask = 9,0x1ff
+    # As in ncompress and gzip, the code width grows once the table passes max_code, which becomes the table size at the maximum width;
+    # a stream with a maximum width of 9 bits therefore still moves on to 10-bit codes
+    max_code,table_size = 0x1ff,1 << max_bits
+    # In block mode, code 256 clears the table
+    first_free = 257 if block_mode else 256
+    table = [bytes([i]) for i in range(256)] + [b'']*(first_free - 256)
+    bit_offset = 0 # bit offset of the next code from the beginning of the group
+    out = []
+    prev = None
+
+    while True:
+        # Codes are written in groups of 8, occupying 'bits' bytes; the group is padded when the code width changes
+        if len(table) > max_code:
+            if bit_offset: pos += bits
+            bit_offset = 0
+            bits += 1
+            mask = (1 << bits) - 1
+            max_code = table_size if bits == max_bits else mask
+        start = pos + (bit_offset >> 3)
+        if start + (bits + (bit_offset & 7) + 7)//8 > n: break
+        code = (int.from_bytes(raw[start:start+3],'little') >> (bit_offset & 7)) & mask
+        bit_offset += bits
+        if bit_offset == 8*bits:
+            pos += bits
+            bit_offset = 0
+
+        if code == 256 and block_mode:
+            if bit_offset: pos += bits
+            bit_offset = 0
+            bits,mask,max_code = 9,0x1ff,0x1ff
+            table = table[:257]
+            prev = None
+            continue
+
+        if code < len(table):
+            entry = table[code]
+        elif code == len(table) and prev is not None:
+            entry = prev + prev[:1]
+        else:
+            raise ValueError('Corrupted data in the format of Unix compress')
+        out.append(entry)
+        if prev is not None and len(table) < table_size:
+            table.append(prev + entry[:1])
+        prev = entry
+
+    return b''.join(out)
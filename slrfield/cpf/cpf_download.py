@@ -7,6 +7,7 @@ from astropy.time import Time
 from warnings import warn
 
 from ..utils.try_download import wget_download
+from .cpf_index import INDEX_FILE,update_index
 
 def download_bycurrent(source,satnames=None,keep=True):
     """
@@ -328,11 +329,16 @@ def cpf_download(satnames = None,date = None,source = 'CDDIS',keep=True):
         cpf_files -> [list of str] list of CPF ephemeris files in CPF directory
 
     Note: if 'date' is provided, then 'satnames' must also be provided.
+    If the index of the local CPF archive 'CPF/cpf_index.db' exists, it is updated with the downloaded files.
+    Compressed files, such as those in the historical archives, are stored as downloaded, since they are decompressed in memory when parsed.
     """  
     dir_cpf_to, cpf_files, cpf_files_missed = cpf_download_prior(satnames,date,source,keep)
     
     if cpf_files_missed: warn('The following cpf files are faild to download:',cpf_files_missed)   
 
+    # Keep the index of the local CPF archive up to date if it has been built
+    if path.exists('CPF/'+INDEX_FILE): update_index('CPF/')
+
     return dir_cpf_to, cpf_files    
 
 def get_cpf_filelist(server,dir_cpf_from,mode):    
@@ -0,0 +1,148 @@
+import sqlite3
+from os import path,walk,stat
+from warnings import warn
+
+from .cpf_read import read_cpf_headers
+from .cpf_time import iso2mjd
+
+INDEX_FILE = 'cpf_index.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cpf_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime INTEGER,
+    target TEXT,
+    cospar_id TEXT,
+    norad_id TEXT,
+    source TEXT,
+    sequence INTEGER,
+    production REAL,
+    start REAL,
+    end REAL,
+    interval REAL
+);
+CREATE INDEX IF NOT EXISTS cpf_files_target ON cpf_files (target, start, end);
+CREATE INDEX IF NOT EXISTS cpf_files_norad ON cpf_files (norad_id);
+CREATE INDEX IF NOT EXISTS cpf_files_cospar ON cpf_files (cospar_id);
+'''
+
+def connect_index(cpf_root):
+    """
+    Open the index database of a local CPF archive, creating it if necessary.
+
+    Usage:
+        conn = connect_index('CPF/')
+
+    Inputs:
+        cpf_root -> [str] root directory of the local CPF archive, such as 'CPF/'
+
+    Outputs:
+        conn -> [object] sqlite3 connection
+    """
+    conn = sqlite3.connect(path.join(cpf_root,INDEX_FILE))
+    conn.executescript(SCHEMA)
+    return conn
+
+def update_index(cpf_root='CPF/'):
+    """
+    Update the index of a local CPF archive incrementally.
+    Only the CPF ephemeris files that are new or modified since the last update are scanned, and only their header records are parsed.
+    Entries of files that no longer exist are removed.
+
+    Usage:
+        n_added,n_removed = update_index()
+        n_added,n_removed = update_index('CPF/CDDIS/')
+
+    Parameters:
+        cpf_root -> [str, default = 'CPF/'] root directory of the local CPF archive. The index is stored as 'cpf_index.db' in this directory.
+
+    Outputs:
+        n_added -> [int] number of new or modified files indexed
+        n_removed -> [int] number of removed entries
+    """
+    conn = connect_index(cpf_root)
+    indexed = {row[0]:(row[1],row[2]) for row in conn.execute('SELECT path, size, mtime FROM cpf_files')}
+
+    rows,found = [],set()
+    for dir_path,_,files in walk(cpf_root):
+        for cpf_file in files:
+            if '_cpf_' not in cpf_file: continue
+            cpf_path = path.join(dir_path,cpf_file)
+            rel_path = path.relpath(cpf_path,cpf_root)
+            found.add(rel_path)
+            info = stat(cpf_path)
+            if indexed.get(rel_path) == (info.st_size,info.st_mtime_ns): continue
+
+            try:
+                data = read_cpf_headers(cpf_path)
+                rows.append((rel_path,info.st_size,info.st_mtime_ns,data['Target Name'],data['COSPAR ID'],data['NORAD ID'],
+                             data['Ephemeris Source'],int(data['Ephemeris Sequence Number']),iso2mjd(data['Time of Ephemeris Production']),
+                             iso2mjd(data['Start']),iso2mjd(data['End']),float(data['Time Interval[sec]'])))
+            except Exception as e:
+                warn('Failed to index the CPF ephemeris file {:s}: {:s}'.format(cpf_path,str(e)))
+
+    removed = [(rel_path,) for rel_path in indexed if rel_path not in found]
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO cpf_files VALUES (?,?,?,?,?,?,?,?,?,?,?,?)',rows)
+        conn.executemany('DELETE FROM cpf_files WHERE path = ?',removed)
+    conn.close()
+
+    return len(rows),len(removed)
+
+def query_index(cpf_root='CPF/',targets=None,epoch=None,t_start=None,t_end=None,source=None,latest=True):
+    """
+    Find the CPF ephemeris files in a local CPF archive that cover a given epoch or time interval.
+
+    Usage:
+        cpf_files = query_index(targets='lageos1',epoch='2017-01-02 12:00:00')
+        cpf_files = query_index('CPF/',['lageos1','7603901','22824'],t_start='2017-01-02 12:00:00',t_end='2017-01-03 12:00:00')
+
+    Parameters:
+        cpf_root -> [str, default = 'CPF/'] root directory of the local CPF archive
+        targets -> [str, list of str, default = None] target names, COSPAR IDs or NORAD IDs. If None, all targets are considered.
+        epoch -> [str or float, default = None] iso-formatted UTC or MJD that the ephemeris has to cover
+        t_start -> [str or float, default = None] beginning of the time interval that the ephemeris has to cover
+        t_end -> [str or float, default = None] end of the time interval that the ephemeris has to cover
+        source -> [str, default = None] ephemeris source, such as 'SGF' or 'HTS'. If None, all sources are considered.
+        latest -> [bool, default = True] If True, only the latest production(with the highest sequence number) for each target is returned.
+
+    Outputs:
+        cpf_files -> [list of str] paths of the CPF ephemeris files relative to cpf_root
+    """
+    if epoch is not None: t_start = t_end = epoch
+    conditions,params = [],[]
+
+    if targets is not None:
+        if type(targets) is str: targets = [targets]
+        marks = ','.join('?'*len(targets))
+        conditions.append('(target IN ({0:s}) OR cospar_id IN ({0:s}) OR norad_id IN ({0:s}))'.format(marks))
+        params += list(targets)*3
+    if t_start is not None:
+        conditions.append('start <= ?')
+        params.append(iso2mjd(t_start) if type(t_start) is str else t_start)
+    if t_end is not None:
+        conditions.append('end >= ?')
+        params.append(iso2mjd(t_end) if type(t_end) is str else t_end)
+    if source is not None:
+        conditions.append('source = ?')
+        params.append(source)
+
+    sql = 'SELECT path, target FROM cpf_files'
+    if conditions: sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY target, production DESC, sequence DESC'
+
+    dir_index_file = path.join(cpf_root,INDEX_FILE)
+    if not path.exists(dir_index_file):
+        raise Exception('No index found in {:s}. Build it with update_index first.'.format(cpf_root))
+    conn = sqlite3.connect(dir_index_file)
+    rows = conn.execute(sql,params).fetchall()
+    conn.close()
+
+    cpf_files,seen = [],set()
+    for rel_path,target in rows:
+        if latest:
+            if target in seen: continue
+            seen.add(target)
+        cpf_files.append(rel_path)
+    return cpf_files
@@ -1,20 +1,33 @@
+from itertools import chain
+from warnings import warn
+
 import numpy as np
+import erfa
 from astropy import units as u
 from astropy.time import Time, TimeDelta
 from astropy.coordinates import SkyCoord, EarthLocation, AltAz
-from scipy.interpolate import BarycentricInterpolator
 from scipy.constants import speed_of_light
 
+from .cpf_time import iso2mjdsod, mjdsod2iso, mjdsod2ns, time2mjdsod, leap_seconds
+from ..slrclasses.cpfephemeris import CPFEphemeris
+from ..slrclasses.timegrid import TimeGrid
+from ..slrclasses.earthorientation import EarthOrientation
+
+# Default provider of the rotation matrices from ITRF to GCRF, whose nodes are cached across calls
+EARTH_ORIENTATION = EarthOrientation()
 
-def cpf_interp_azalt(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, t_start, t_end, t_increment, mode, station, coord_type):
+
+def cpf_interp_azalt(ephemeris, *args, method='lagrange', engine='native', polar_motion=False, light_time_tolerance=None):
     """
     Interpolate the CPF ephemeris and make the prediction in topocentric reference frame.
 
     Usage: 
-        ts_isot,ts_mjd,ts_sod,az,alt,r,tof1 = cpf_interpolate(ts_utc_cpf,ts_mjd_cpf,ts_sod_cpf,leap_second_cpf,positions_cpf,t_start,t_end,t_increment,mode,station,coord_type)
-        ts_isot,ts_mjd,ts_sod,az_trans,alt_trans,delta_az,delta_alt,r_trans,tof2 = cpf_interpolate(ts_utc_cpf,ts_mjd_cpf,ts_sod_cpf,leap_second_cpf,positions_cpf,t_start,t_end,t_increment,mode,station,coord_type)
+        ts_isot,ts_mjd,ts_sod,az,alt,r,tof1 = cpf_interp_azalt(ephemeris,t_start,t_end,t_increment,mode,station,coord_type)
+        ts_isot,ts_mjd,ts_sod,az,alt,r,tof1 = cpf_interp_azalt(ts_utc_cpf,ts_mjd_cpf,ts_sod_cpf,leap_second_cpf,positions_cpf,t_start,t_end,t_increment,mode,station,coord_type)
+        ts_isot,ts_mjd,ts_sod,az_trans,alt_trans,delta_az,delta_alt,r_trans,tof2 = cpf_interp_azalt(ephemeris,t_start,t_end,t_increment,mode,station,coord_type)
 
     Inputs:
+        ephemeris -> [object] instance of class CPFEphemeris as returned by read_cpf; alternatively, the CPF ephemeris can be given by the following 5 arrays.
         ts_utc_cpf -> [str array] iso-formatted UTC for CPF ephemeris 
         ts_mjd_cpf -> [int array] MJD for CPF ephemeris 
         ts_sod_cpf -> [float array] Second of Day for CPF ephemeris 
@@ -29,6 +42,15 @@ def cpf_interp_azalt(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positi
         Unit for (x, y, z) are meter, and for (lon, lat, height) are degree and meter.
         coord_type -> [str] coordinates type for coordinates of station; it can either be 'geocentric' or 'geodetic'.
 
+    Parameters:
+        method -> [str, default = 'lagrange'] interpolation method; 'lagrange' for the 10-point Lagrange interpolation of the position records,
+        or 'hermite' for the 4-point Hermite interpolation of the position and velocity records(type 20), which narrows the unusable records at each end of the CPF ephemeris from 4 to 1.
+        engine -> [str, default = 'native'] transformation to the topocentric reference frame; 'native' for the direct rotation of the station-to-target vectors in ITRF,
+        or 'astropy' for the transformation through the celestial frames of astropy as a reference; see itrs2horizon
+        polar_motion -> [bool, default = False] whether the native engine refers the azimuth and altitude to the Celestial Intermediate Pole
+        light_time_tolerance -> [float, default = None] for the apparent mode, tolerance in seconds for the iterated solution of the light time of the transmitting and receiving paths.
+        If None, the light time is taken in a single step from the instantaneous range, that is, tau = r/c.
+
     Outputs:
         (1) If the mode is 'geometric', then the transmitting direction of the laser coincides with the receiving direction at a certain moment. 
         In this case, the light time is not considered and the outputs are
@@ -52,41 +74,18 @@ def cpf_interp_azalt(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positi
         r_trans -> [float array] Transmitting range for interpolated prediction in meters
         tof2 -> [float array] Time of flight for interpolated prediction in seconds
     """
-    t_start, t_end = Time(t_start), Time(t_end)
-    t_start_interp, t_end_interp = Time(ts_utc_cpf[4]), Time(ts_utc_cpf[-5])
-
-    if t_start < t_start_interp or t_end > t_end_interp:
-        raise ValueError('({:s}, {:s}) is outside the interpolation range of prediction ({:s}, {:s})'.format(
-            t_start.isot, t_end.isot, t_start_interp.isot, t_end_interp.isot))
-
-    ts = t_list(t_start, t_end, t_increment)
-    ts_mjd = ts.mjd.astype(int)
-    ts_isot = ts.isot
-    ts_sod = iso2sod(ts_isot)
-
-    leap_second = np.zeros_like(ts_mjd)
+    ephemeris, (t_start, t_end, t_increment, mode, station, coord_type) = ephemeris_args(ephemeris, args, 6)
+    interp, margin = interpolator(ephemeris, method)
 
-    ts_mjd_median = np.median(ts_mjd_cpf)
-    ts_mjd_demedian = ts_mjd - ts_mjd_median
-    ts_mjd_cpf_demedian = ts_mjd_cpf - ts_mjd_median
+    check_range(ephemeris, t_start, t_end, margin)
+    grid = TimeGrid.from_range(t_start, t_end, t_increment)
+    ts_mjd, ts_sod = grid.mjdsod()
+    ts_isot = mjdsod2iso(ts_mjd, ts_sod, sep='T')
+    # The Astropy Time object is only built for the frame transformations that need it
+    ts = grid.to_time() if engine == 'astropy' or polar_motion else None
 
-    if leap_second_cpf.any():  # Identify whether the CPF ephemeris includes the leap second
-        leap_second_boundary = np.diff(leap_second_cpf).nonzero()[0][0] + 1
-        value = leap_second_cpf[leap_second_boundary]
-        mjd_cpf_boundary = ts_mjd_cpf[leap_second_boundary]
-
-        condition = (ts_mjd == mjd_cpf_boundary)
-
-        # If the CPF ephemeris includes the leap second, then we need to identify whether the interpolated prediction includes the leap second.
-        if condition.any():
-            leap_index = np.where(condition)[0][0]
-            leap_second[leap_index:] = value
-
-    ts_quasi_mjd = ts_mjd_demedian + (ts_sod+leap_second)/86400
-    ts_quasi_mjd_cpf = ts_mjd_cpf_demedian + (ts_sod_cpf+leap_second_cpf)/86400
-
-    positions = interp_ephem(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf)
-    az, alt, r = itrs2horizon(station, ts, positions, coord_type)
+    positions, = interp_epochs(ephemeris, interp, ts_mjd, ts_sod)
+    az, alt, r = itrs2horizon(station, ts, positions, coord_type, engine, polar_motion)
 
     if mode == 'geometric':
         tof1 = 2*r/speed_of_light
@@ -94,17 +93,30 @@ def cpf_interp_azalt(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positi
 
     elif mode == 'apparent':
 
-        tau = r/speed_of_light
-        ts_quasi_mjd_trans = ts_mjd_demedian + (ts_sod+leap_second+tau)/86400
-        ts_quasi_mjd_recei = ts_mjd_demedian + (ts_sod+leap_second-tau)/86400
-        positions_trans = interp_ephem(
-            ts_quasi_mjd_trans, ts_quasi_mjd_cpf, positions_cpf)
-        positions_recei = interp_ephem(
-            ts_quasi_mjd_recei, ts_quasi_mjd_cpf, positions_cpf)
-        az_trans, alt_trans, r_trans = itrs2horizon(
-            station, ts, positions_trans, coord_type)
-        az_recei, alt_recei, r_recei = itrs2horizon(
-            station, ts, positions_recei, coord_type)
+        # The transmitting(t + tau) and receiving(t - tau) epochs are stacked, so that each step of the light time takes one interpolation and one transformation
+        n = len(ts_sod)
+        index, sign = np.tile(np.arange(n), 2), np.repeat([1, -1], n)
+        tau = np.tile(r/speed_of_light, 2)
+        az, alt, r = np.empty(2*n), np.empty(2*n), np.empty(2*n)
+        # Epochs drop out of the iteration once their light time has converged
+        active = np.arange(2*n)
+        for iteration in range(1 if light_time_tolerance is None else 10):
+            positions, = interp_epochs(ephemeris, interp, ts_mjd[index[active]], ts_sod[index[active]] + sign[active]*tau[active])
+            ts_active = None if ts is None else ts[index[active]]
+            az[active], alt[active], r[active] = itrs2horizon(
+                station, ts_active, positions, coord_type, engine, polar_motion)
+            if light_time_tolerance is None: break
+
+            tau_new = r[active]/speed_of_light
+            converged = np.abs(tau_new - tau[active]) <= light_time_tolerance
+            tau[active] = tau_new
+            active = active[~converged]
+            if len(active) == 0: break
+        else:
+            warn('The light time has not converged to the tolerance of {:g} seconds for {:d} epochs'.format(light_time_tolerance, len(active)))
+
+        az_trans, alt_trans, r_trans = az[:n], alt[:n], r[:n]
+        az_recei, alt_recei = az[n:], alt[n:]
         tof2 = 2*r_trans/speed_of_light
         delta_az = az_recei - az_trans
         delta_alt = alt_recei - alt_trans
@@ -114,59 +126,62 @@ def cpf_interp_azalt(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positi
         raise Exception("Mode must be 'geometric' or 'apparent'.")
 
 
-def cpf_interp_xyz_times(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, times):
-
-    t_start = Time(times[0])
-    t_end = Time(times[-1])
-    # t_start, t_end = Time(t_start), Time(t_end)
-    t_start_interp, t_end_interp = Time(ts_utc_cpf[4]), Time(ts_utc_cpf[-5])
-
-    if t_start < t_start_interp or t_end > t_end_interp:
-        raise ValueError('({:s}, {:s}) is outside the interpolation range of prediction ({:s}, {:s})'.format(
-            t_start.isot, t_end.isot, t_start_interp.isot, t_end_interp.isot))
-
-    ts = Time(times)
-    ts_mjd = ts.mjd.astype(int)
-    ts_isot = ts.isot
-    ts_sod = iso2sod(ts_isot)
+def cpf_interp_xyz_times(ephemeris, *args, derivatives=0, method='lagrange'):
+    """
+    Interpolate the CPF ephemeris at given times and make the prediction in ITRF.
 
-    leap_second = np.zeros_like(ts_mjd)
+    Usage:
+        ts_isot,ts_mjd,ts_sod,x,y,z = cpf_interp_xyz_times(ephemeris,times)
+        ts_isot,ts_mjd,ts_sod,x,y,z = cpf_interp_xyz_times(ts_utc_cpf,ts_mjd_cpf,ts_sod_cpf,leap_second_cpf,positions_cpf,times)
+        ts_isot,ts_mjd,ts_sod,x,y,z,vx,vy,vz,ax,ay,az = cpf_interp_xyz_times(ephemeris,times,derivatives=2)
 
-    ts_mjd_median = np.median(ts_mjd_cpf)
-    ts_mjd_demedian = ts_mjd - ts_mjd_median
-    ts_mjd_cpf_demedian = ts_mjd_cpf - ts_mjd_median
+    Inputs:
+        ephemeris -> [object] instance of class CPFEphemeris as returned by read_cpf; alternatively, the CPF ephemeris can be given by the arrays as in cpf_interp_xyz.
+        times -> [str array] iso-formatted UTC for the prediction, in any order, such as scattered epochs of ranging observations
 
-    if leap_second_cpf.any():  # Identify whether the CPF ephemeris includes the leap second
-        leap_second_boundary = np.diff(leap_second_cpf).nonzero()[0][0] + 1
-        value = leap_second_cpf[leap_second_boundary]
-        mjd_cpf_boundary = ts_mjd_cpf[leap_second_boundary]
+    Parameters:
+        derivatives -> [int, default = 0] If 1, the velocities are also returned; if 2, the velocities and accelerations are returned.
+        They are the time derivatives of the same interpolating polynomial as the positions.
+        method -> [str, default = 'lagrange'] interpolation method; 'lagrange' for the 10-point Lagrange interpolation of the position records,
+        or 'hermite' for the 4-point Hermite interpolation of the position and velocity records(type 20), which narrows the unusable records at each end of the CPF ephemeris from 4 to 1.
 
-        condition = (ts_mjd == mjd_cpf_boundary)
+    Outputs:
+        ts_isot -> [str array] isot-formatted UTC for interpolated prediction
+        ts_mjd -> [int array] MJD for interpolated prediction
+        ts_sod -> [float array] Second of Day for for interpolated prediction
+        x -> [float array] Coordinate x for interpolated prediction in [m]
+        y -> [float array] Coordinate y for interpolated prediction in [m]
+        z -> [float array] Coordinate z for interpolated prediction in [m]
+        vx, vy, vz -> [float array] Velocity for interpolated prediction in [m/s]; only returned if derivatives >= 1
+        ax, ay, az -> [float array] Acceleration for interpolated prediction in [m/s^2]; only returned if derivatives == 2
+    """
+    ephemeris, (times,) = ephemeris_args(ephemeris, args, 1)
+    interp, margin = interpolator(ephemeris, method)
 
-        # If the CPF ephemeris includes the leap second, then we need to identify whether the interpolated prediction includes the leap second.
-        if condition.any():
-            leap_index = np.where(condition)[0][0]
-            leap_second[leap_index:] = value
+    ts = Time(times)
+    check_range(ephemeris, ts.min(), ts.max(), margin)
 
-    ts_quasi_mjd = ts_mjd_demedian + (ts_sod+leap_second)/86400
-    ts_quasi_mjd_cpf = ts_mjd_cpf_demedian + (ts_sod_cpf+leap_second_cpf)/86400
+    ts_mjd, ts_sod = time2mjdsod(ts)
+    ts_isot = mjdsod2iso(ts_mjd, ts_sod, sep='T')
 
-    positions = interp_ephem(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf)
+    results = interp_epochs(ephemeris, interp, ts_mjd, ts_sod, derivatives)
     # x, y, z = itrs2gcrf(ts, positions)
-    x, y, z = positions[:, 0], positions[:, 1], positions[:, 2]
+    xyz = [component for result in results for component in result.T]
 
-    return ts_isot, ts_mjd, ts_sod, x, y, z
+    return (ts_isot, ts_mjd, ts_sod, *xyz)
 
 
-def cpf_interp_xyz(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, t_start, t_end, t_increment):
+def cpf_interp_xyz(ephemeris, *args, derivatives=0, method='lagrange', engine='cached'):
     """
     Interpolate the CPF ephemeris and make the prediction in GCRF
 
     Usage: 
-        ts_isot,ts_mjd,ts_sod,az,alt,r,tof1 = cpf_interpolate(ts_utc_cpf,ts_mjd_cpf,ts_sod_cpf,leap_second_cpf,positions_cpf,t_start,t_end,t_increment,mode,station,coord_type)
-        ts_isot,ts_mjd,ts_sod,az_trans,alt_trans,delta_az,delta_alt,r_trans,tof2 = cpf_interpolate(ts_utc_cpf,ts_mjd_cpf,ts_sod_cpf,leap_second_cpf,positions_cpf,t_start,t_end,t_increment,mode,station,coord_type)
+        ts_isot,ts_mjd,ts_sod,x,y,z = cpf_interp_xyz(ephemeris,t_start,t_end,t_increment)
+        ts_isot,ts_mjd,ts_sod,x,y,z = cpf_interp_xyz(ts_utc_cpf,ts_mjd_cpf,ts_sod_cpf,leap_second_cpf,positions_cpf,t_start,t_end,t_increment)
+        ts_isot,ts_mjd,ts_sod,x,y,z,vx,vy,vz = cpf_interp_xyz(ephemeris,t_start,t_end,t_increment,derivatives=1)
 
     Inputs:
+        ephemeris -> [object] instance of class CPFEphemeris as returned by read_cpf; alternatively, the CPF ephemeris can be given by the following 5 arrays.
         ts_utc_cpf -> [str array] iso-formatted UTC for CPF ephemeris 
         ts_mjd_cpf -> [int array] MJD for CPF ephemeris 
         ts_sod_cpf -> [float array] Second of Day for CPF ephemeris 
@@ -176,6 +191,14 @@ def cpf_interp_xyz(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, position
         t_end -> [str] ending date and time of ephemeris
         t_increment -> [float or int] time increment in second for ephemeris interpolation, such as 0.5, 1, 2, 5, etc. 
 
+    Parameters:
+        derivatives -> [int, default = 0] If 1, the velocities are also returned; if 2, the velocities and accelerations are returned.
+        They are the time derivatives of the same interpolating polynomial as the positions, transformed to GCRF with the rotation of the Earth taken into account.
+        method -> [str, default = 'lagrange'] interpolation method; 'lagrange' for the 10-point Lagrange interpolation of the position records,
+        or 'hermite' for the 4-point Hermite interpolation of the position and velocity records(type 20), which narrows the unusable records at each end of the CPF ephemeris from 4 to 1.
+        engine -> [str or object, default = 'cached'] source of the rotation from ITRF to GCRF; 'cached' for the interpolated Earth orientation of class EarthOrientation,
+        an instance of class EarthOrientation, or 'astropy' for the full transformation of astropy at every epoch; see itrs2gcrf_rotation
+
     Outputs:
         ts_isot -> [str array] isot-formatted UTC for interpolated prediction
         ts_mjd -> [int array] MJD for interpolated prediction
@@ -183,52 +206,499 @@ def cpf_interp_xyz(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, position
         x -> [float array] Azimuth for interpolated prediction in degrees
         y -> [float array] Altitude for interpolated prediction in degrees
         z -> [float array] Range for interpolated prediction in meters
+        vx, vy, vz -> [float array] Velocity for interpolated prediction in [m/s]; only returned if derivatives >= 1
+        ax, ay, az -> [float array] Acceleration for interpolated prediction in [m/s^2]; only returned if derivatives == 2
+    """
+    ephemeris, (t_start, t_end, t_increment) = ephemeris_args(ephemeris, args, 3)
+    interp, margin = interpolator(ephemeris, method)
+
+    check_range(ephemeris, t_start, t_end, margin)
+    grid = TimeGrid.from_range(t_start, t_end, t_increment)
+    ts_mjd, ts_sod = grid.mjdsod()
+    ts_isot = mjdsod2iso(ts_mjd, ts_sod, sep='T')
+    # The Astropy Time object is only built for the frame transformations
+    ts = grid.to_time()
+
+    results = interp_epochs(ephemeris, interp, ts_mjd, ts_sod, derivatives)
+    if derivatives == 0:
+        x, y, z = itrs2gcrf(ts, results[0], engine)
+        return ts_isot, ts_mjd, ts_sod, x, y, z
+
+    xyz = [component for result in itrs2gcrf_derivatives(ts, *results, engine=engine) for component in result.T]
+
+    return (ts_isot, ts_mjd, ts_sod, *xyz)
+
+
+def cpf_interp_xyz_stack(ephemerides, times, frame='itrs', engine='cached'):
+    """
+    Interpolate a collection of CPF ephemerides, such as all targets of a constellation, at a common set of epochs in a single vectorized pass.
+    The records of all CPF ephemerides are concatenated, and the windows of all (target, epoch) pairs are located by one merge of the records and the epochs.
+
+    Usage:
+        positions = cpf_interp_xyz_stack(ephemerides,times)
+        positions = cpf_interp_xyz_stack(ephemerides,times,frame='gcrf')
+
+    Inputs:
+        ephemerides -> [list of object] instances of class CPFEphemeris as returned by read_cpf
+        times -> [str array] iso-formatted UTC for the prediction, in any order
+
+    Parameters:
+        frame -> [str, default = 'itrs'] reference frame of the outputs, 'itrs' or 'gcrf'
+        engine -> [str or object, default = 'cached'] source of the rotation from ITRF to GCRF; see itrs2gcrf_rotation
+
+    Outputs:
+        positions -> [3d float array] target positions in cartesian coordinates in meters with shape of (number of targets, number of epochs, 3).
+        Epochs outside the interpolation range of a CPF ephemeris, which is from the 5th record to the 5th last record, are filled with NaN for that target.
+    """
+    if frame not in ('itrs', 'gcrf'):
+        raise Exception("Frame must be 'itrs' or 'gcrf'.")
+
+    ts = Time(times)
+    ts_mjd, ts_sod = time2mjdsod(ts)
+    ts_mjd, ts_sod = np.atleast_1d(ts_mjd), np.atleast_1d(ts_sod)
+    n_targets, n_epochs = len(ephemerides), len(ts_mjd)
+    if n_targets == 0: return np.empty((0, n_epochs, 3))
+
+    counts = np.array([len(ephemeris.mjd) for ephemeris in ephemerides])
+    if (counts < 10).any():
+        raise ValueError('At least 10 position records are required for the interpolation')
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    mjd_cpf = np.concatenate([ephemeris.mjd for ephemeris in ephemerides])
+    positions_cpf = np.concatenate([ephemeris.positions for ephemeris in ephemerides])
+    sod_cpf = np.concatenate([ephemeris.sod for ephemeris in ephemerides])
+
+    # All epochs are counted in integer nanoseconds from a common reference MJD, as in interp_epochs
+    mjd_ref = ts_mjd.min()
+    ts_ns_cpf = mjdsod2ns(mjd_cpf, sod_cpf, leap_seconds(mjd_cpf, mjd_ref), mjd_ref)
+    ts_ns = np.tile(mjdsod2ns(ts_mjd, ts_sod, leap_seconds(ts_mjd, mjd_ref), mjd_ref), n_targets)
+
+    # Merge the records and the epochs ordered by target and time, with the records before the epochs at equal times,
+    # so that the number of records preceding an epoch gives the index of the last record on or before it
+    targets = np.repeat(np.arange(n_targets), n_epochs)
+    merged = np.lexsort((np.repeat([0, 1], [len(mjd_cpf), len(ts_ns)]),
+                         np.concatenate((ts_ns_cpf, ts_ns)),
+                         np.concatenate((np.repeat(np.arange(n_targets), counts), targets))))
+    is_epoch = merged >= len(mjd_cpf)
+    order = merged[is_epoch] - len(mjd_cpf)
+    index = np.cumsum(~is_epoch)[is_epoch] - 1
+
+    targets = targets[order]
+    ts_ns = ts_ns[order]
+    starts = np.clip(index - 4, offsets[targets], offsets[targets+1] - 10)
+    windows, inverse = group_windows(starts)
+    positions, = lagrange_windows(ts_ns, ts_ns_cpf, positions_cpf, starts, windows, inverse)
+
+    outside = (ts_ns < ts_ns_cpf[offsets[targets] + 4]) | (ts_ns > ts_ns_cpf[offsets[targets+1] - 5])
+    positions[outside] = np.nan
+    positions = scatter_results(order, [positions]).reshape(n_targets, n_epochs, 3)
+
+    if frame == 'gcrf':
+        positions = np.einsum('eij,tej->tei', itrs2gcrf_rotation(ts, engine), positions)
+
+    return positions
+
+
+def cpf_interp_azalt_network(ephemerides, stations, times, coord_type='geodetic', polar_motion=False):
+    """
+    Predict the azimuth, altitude and range of a collection of targets from a network of stations at a common set of epochs in a single broadcast computation.
+    The CPF ephemerides are interpolated once by cpf_interp_xyz_stack and shared by all stations, and the rotation matrices to the local east, north and up directions
+    are computed once per station. The topocentric coordinates are geometric, as with the native engine of itrs2horizon.
+
+    Usage:
+        az,alt,r = cpf_interp_azalt_network(ephemerides,stations,times)
+        az,alt,r = cpf_interp_azalt_network(ephemerides,stations,times,'geocentric',polar_motion=True)
+
+    Inputs:
+        ephemerides -> [list of object] instances of class CPFEphemeris as returned by read_cpf
+        stations -> [2d float array] coordinates of stations with shape of (number of stations, 3). They can either be geocentric(x, y, z) coordinates or geodetic(lon, lat, height) coordinates.
+        Unit for (x, y, z) are meter, and for (lon, lat, height) are degree and meter.
+        times -> [str array or object of class Astropy Time] UTC for the prediction, in any order
+
+    Parameters:
+        coord_type -> [str, default = 'geodetic'] coordinates type for coordinates of stations; it can either be 'geocentric' or 'geodetic'.
+        polar_motion -> [bool, default = False] whether to refer the azimuth and altitude to the Celestial Intermediate Pole
+
+    Outputs:
+        az -> [3d float array] Azimuth in degrees with shape of (number of stations, number of targets, number of epochs)
+        alt -> [3d float array] Altitude in degrees with the same shape
+        r -> [3d float array] Range in meters with the same shape
+        Epochs outside the interpolation range of a CPF ephemeris are filled with NaN for that target.
+    """
+    ts = Time(times)
+    positions = cpf_interp_xyz_stack(ephemerides, ts)
+    if polar_motion:
+        # The rotation to the terrestrial intermediate reference system is shared by the stations, so it is applied to the positions and the stations alike
+        w = polar_motion_matrix(ts)
+        positions = np.einsum('eji,tej->tei', w, positions)
+
+    # Stations are resolved together, with their coordinates as the columns
+    site_xyz, lon, lat = station_geodetic(np.atleast_2d(np.asarray(stations, dtype=float)).T, coord_type)
+    site_xyz = site_xyz.T
+    enu = enu_matrix(lon, lat)
+
+    # The vectors from the stations to the targets are rotated with shape of (stations, targets, epochs, 3)
+    if polar_motion:
+        site_xyz = np.einsum('eji,sj->sei', w, site_xyz)[:, None]
+    else:
+        site_xyz = site_xyz[:, None, None]
+    vectors = positions[None] - site_xyz
+    return enu2azalt(np.einsum('sij,stej->stei', enu, vectors))
+
+
+def interp_epochs(ephemeris, interp, ts_mjd, ts_sod, derivatives=0):
+    """
+    Interpolate the CPF ephemeris at epochs given by MJD and Second of Day in UTC, which is the common path of cpf_interp_azalt, cpf_interp_xyz and cpf_interp_xyz_times.
+    The epochs and the records are placed on one time axis of integer nanoseconds from the first day of the CPF ephemeris, with the leap seconds of the table of TAI-UTC folded in,
+    so the windows are located exactly and the differences between the epochs and the records are free of rounding.
+
+    Usage:
+        positions, = interp_epochs(ephemeris, interp, ts_mjd, ts_sod)
+        positions, velocities = interp_epochs(ephemeris, interp, ts_mjd, ts_sod, derivatives=1)
+
+    Inputs:
+        ephemeris -> [object] instance of class CPFEphemeris
+        interp -> [function] interpolation function as returned by interpolator
+        ts_mjd -> [int array] MJD for interpolated prediction
+        ts_sod -> [float array] Second of Day for interpolated prediction
+
+    Parameters:
+        derivatives -> [int, default = 0] highest order of the time derivatives to return, which is 0, 1 or 2.
+
+    Outputs:
+        results -> [list of 2d float array] target positions in meters w.r.t. ITRF, followed by the velocities in meters per second and the accelerations in meters per second squared if requested
+    """
+    mjd_ref = int(ephemeris.mjd[0])
+    ts_ns_cpf = mjdsod2ns(ephemeris.mjd, ephemeris.sod, leap_seconds(ephemeris.mjd, mjd_ref), mjd_ref)
+    ts_ns = mjdsod2ns(ts_mjd, ts_sod, leap_seconds(ts_mjd, mjd_ref), mjd_ref)
+
+    results = interp(ts_ns, ts_ns_cpf, ephemeris.positions, derivatives)
+    if derivatives == 0: return [results]
+    # The derivatives per nanosecond are converted to per second
+    return [result*1e9**order for order, result in enumerate(results)]
+
+
+def ephemeris_args(ephemeris, args, n_args):
     """
-    t_start, t_end = Time(t_start), Time(t_end)
-    t_start_interp, t_end_interp = Time(ts_utc_cpf[4]), Time(ts_utc_cpf[-5])
+    Sort out the arguments of the interpolation functions, where the CPF ephemeris is given either as an instance of class CPFEphemeris,
+    or as the arrays ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf.
+
+    Usage:
+        ephemeris, (t_start, t_end, t_increment) = ephemeris_args(ephemeris, args, 3)
 
-    if t_start < t_start_interp or t_end > t_end_interp:
+    Inputs:
+        ephemeris -> [object or str array] instance of class CPFEphemeris, or ts_utc_cpf
+        args -> [tuple] remaining positional arguments
+        n_args -> [int] number of arguments following the CPF ephemeris
+
+    Outputs:
+        ephemeris -> [object] instance of class CPFEphemeris
+        args -> [tuple] arguments following the CPF ephemeris
+    """
+    if not isinstance(ephemeris, CPFEphemeris):
+        if len(args) < 4:
+            raise TypeError('The CPF ephemeris must be an instance of class CPFEphemeris or given by 5 arrays')
+        # The iso-formatted UTC of the CPF ephemeris is not needed, as the epochs are handled by MJD and Second of Day
+        ephemeris = CPFEphemeris({}, *args[:4])
+        args = args[4:]
+    if len(args) != n_args:
+        raise TypeError('{:d} arguments are expected after the CPF ephemeris, but {:d} were given'.format(n_args, len(args)))
+    return ephemeris, args
+
+
+def check_range(ephemeris, t_start, t_end, margin=4):
+    """
+    Check that the prediction span is within the interpolation range of the CPF ephemeris, which is from the 5th record to the 5th last record
+    for the 10-point Lagrange interpolation. Epochs are compared numerically by MJD and Second of Day, so the iso-formatted UTC of the CPF ephemeris is not needed.
+
+    Usage:
+        check_range(ephemeris, t_start, t_end)
+        check_range(ephemeris, t_start, t_end, margin=1)
+
+    Inputs:
+        ephemeris -> [object] instance of class CPFEphemeris
+        t_start -> [str or object of class Astropy Time] starting date and time of prediction
+        t_end -> [str or object of class Astropy Time] ending date and time of prediction
+
+    Parameters:
+        margin -> [int, default = 4] number of records at each end of the CPF ephemeris that are outside the interpolation range
+    """
+    mjd, sod = ephemeris.mjd, ephemeris.sod
+    if len(mjd) < 2*margin + 2:
+        raise ValueError('At least {:d} position records are required for the interpolation'.format(2*margin + 2))
+
+    # Second of Day runs up to 86401 on a day with a leap second, so (MJD, SoD) pairs order UTC epochs correctly
+    first, last = margin, -1 - margin
+    if iso2mjdsod(t_start) < (mjd[first], sod[first]) or iso2mjdsod(t_end) > (mjd[last], sod[last]):
+        t_start_interp, t_end_interp = mjdsod2iso(mjd[[first, last]], sod[[first, last]])
         raise ValueError('({:s}, {:s}) is outside the interpolation range of prediction ({:s}, {:s})'.format(
-            t_start.isot, t_end.isot, t_start_interp.isot, t_end_interp.isot))
+            str(t_start), str(t_end), t_start_interp, t_end_interp))
 
-    ts = t_list(t_start, t_end, t_increment)
-    ts_mjd = ts.mjd.astype(int)
-    ts_isot = ts.isot
-    ts_sod = iso2sod(ts_isot)
 
-    leap_second = np.zeros_like(ts_mjd)
+def cpf_interp_stream(records, t_start, t_end, t_increment, chunk_size=86400):
+    """
+    Interpolate the CPF ephemeris consumed from a stream of records and make the prediction in ITRF chunk by chunk.
+    Only the current chunk of CPF records, with 10 records carried over from the previous chunk for the interpolation windows, and one chunk of the prediction are held in memory.
 
-    ts_mjd_median = np.median(ts_mjd_cpf)
-    ts_mjd_demedian = ts_mjd - ts_mjd_median
-    ts_mjd_cpf_demedian = ts_mjd_cpf - ts_mjd_median
+    Usage:
+        for ts_mjd, ts_sod, positions in cpf_interp_stream(iter_cpf(cpf_dir, cpf_file), t_start, t_end, t_increment):
+            ...
 
-    if leap_second_cpf.any():  # Identify whether the CPF ephemeris includes the leap second
-        leap_second_boundary = np.diff(leap_second_cpf).nonzero()[0][0] + 1
-        value = leap_second_cpf[leap_second_boundary]
-        mjd_cpf_boundary = ts_mjd_cpf[leap_second_boundary]
+    Inputs:
+        records -> [iterator] stream of CPF records as generated by iter_cpf
+        t_start -> [str] starting date and time of ephemeris
+        t_end -> [str] ending date and time of ephemeris
+        t_increment -> [float or int] time increment in second for ephemeris interpolation, such as 0.5, 1, 2, 5, etc.
+
+    Parameters:
+        chunk_size -> [int, default = 86400] maximum number of interpolated epochs in each output chunk
+
+    Outputs:
+        generator of (ts_mjd, ts_sod, positions), where
+        ts_mjd -> [int array] MJD for interpolated prediction
+        ts_sod -> [float array] Second of Day for interpolated prediction
+        positions -> [2d float array] target positions in cartesian coordinates in meters w.r.t. ITRF for interpolated prediction
+    """
+    grid = TimeGrid.from_range(str(t_start), str(t_end), t_increment)
+    n_epochs = len(grid)
+
+    # The records and the epochs are placed on the time axis of interp_epochs, in integer nanoseconds from the first day of the records with the leap seconds folded in
+    ts_mjd_cpf, ts_ns_cpf, positions_cpf = None, None, None
+    k = 0  # index of the next epoch to interpolate
+    first = True
+
+    for record_type, content in chain(records, [(None, None)]):
+        if record_type == '10':
+            if ts_mjd_cpf is None:
+                mjd_ref = int(content['MJD'][0])
+                ts_mjd_cpf, ts_ns_cpf, positions_cpf = np.empty(0, dtype=int), np.empty(0, dtype=np.int64), np.empty((0, 3))
+            ts_mjd_cpf = np.concatenate((ts_mjd_cpf, content['MJD']))
+            ts_ns_cpf = np.concatenate((ts_ns_cpf, mjdsod2ns(content['MJD'], content['SoD'], leap_seconds(content['MJD'], mjd_ref), mjd_ref)))
+            positions_cpf = np.concatenate((positions_cpf, content['positions[m]']))
+            final = False
+            if len(ts_mjd_cpf) < 10: continue
+        elif record_type is None:
+            final = True
+            if first and (ts_mjd_cpf is None or len(ts_mjd_cpf) < 10):
+                raise ValueError('At least 10 position records are required for the interpolation')
+        else:
+            continue
 
-        condition = (ts_mjd == mjd_cpf_boundary)
+        # Epochs are interpolated up to the 5th last record, which is the end of the last full interpolation window;
+        # the records beyond it are carried over to the next chunk.
+        while k < n_epochs:
+            ts_mjd, ts_sod = grid.mjdsod(slice(k, min(k+chunk_size, n_epochs)))
+            ts_ns = mjdsod2ns(ts_mjd, ts_sod, leap_seconds(ts_mjd, mjd_ref), mjd_ref)
 
-        # If the CPF ephemeris includes the leap second, then we need to identify whether the interpolated prediction includes the leap second.
-        if condition.any():
-            leap_index = np.where(condition)[0][0]
-            leap_second[leap_index:] = value
+            if first and ts_ns[0] < ts_ns_cpf[4]:
+                raise ValueError('({:s}, {:s}) is outside the interpolation range of prediction'.format(str(t_start), str(t_end)))
+            first = False
 
-    ts_quasi_mjd = ts_mjd_demedian + (ts_sod+leap_second)/86400
-    ts_quasi_mjd_cpf = ts_mjd_cpf_demedian + (ts_sod_cpf+leap_second_cpf)/86400
+            n_ready = np.searchsorted(ts_ns, ts_ns_cpf[-5], side='right' if final else 'left')
+            if n_ready == 0: break
+            # The epochs of the grid are in ascending order, so no reordering is needed
+            order, ts_ready, starts, windows, inverse = window_groups(ts_ns[:n_ready], ts_ns_cpf, 10)
+            positions, = lagrange_windows(ts_ready, ts_ns_cpf, positions_cpf, starts, windows, inverse)
+            yield ts_mjd[:n_ready], ts_sod[:n_ready], scatter_results(order, [positions])
+            k += n_ready
+            if n_ready < len(ts_ns): break
 
-    positions = interp_ephem(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf)
-    x, y, z = itrs2gcrf(ts, positions)
+        ts_mjd_cpf, ts_ns_cpf, positions_cpf = ts_mjd_cpf[-10:], ts_ns_cpf[-10:], positions_cpf[-10:]
 
-    return ts_isot, ts_mjd, ts_sod, x, y, z
+    if k < n_epochs:
+        raise ValueError('({:s}, {:s}) is outside the interpolation range of prediction'.format(str(t_start), str(t_end)))
 
 
-def interp_ephem(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf):
+def interpolator(ephemeris, method):
+    """
+    Select the interpolation method for the CPF ephemeris.
+
+    Usage:
+        interp, margin = interpolator(ephemeris, 'hermite')
+        positions = interp(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf)
+
+    Inputs:
+        ephemeris -> [object] instance of class CPFEphemeris
+        method -> [str] 'lagrange' for the 10-point Lagrange interpolation of the position records, 
+        or 'hermite' for the 4-point Hermite interpolation of the position and velocity records
+
+    Outputs:
+        interp -> [function] interpolation function with the same arguments as interp_ephem
+        margin -> [int] number of records at each end of the CPF ephemeris that are outside the interpolation range
+    """
+    if method == 'lagrange':
+        return interp_ephem, 4
+    elif method == 'hermite':
+        if len(ephemeris.velocities) == 0 or len(ephemeris.velocities) != len(ephemeris.positions):
+            raise ValueError('The Hermite interpolation requires the velocity records(type 20) in the CPF ephemeris')
+        # Velocities are converted to meters per nanosecond for the time axis of interp_epochs
+        velocities_cpf = ephemeris.velocities*1e-9
+
+        def interp(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf, derivatives=0):
+            return hermite_ephem(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf, velocities_cpf, derivatives)
+        return interp, 1
+    else:
+        raise Exception("Method must be 'lagrange' or 'hermite'.")
+
+
+def hermite_ephem(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf, velocities_cpf, derivatives=0):
+    """
+    Interpolate the CPF ephemeris using the 4-point(degree 7) Hermite polynomial interpolation method, which matches both the position and velocity records.
+    For each epoch, the window of 4 CPF records is located by binary search, starting 1 record before the last record on or before the epoch,
+    and shifted inwards at both ends of the CPF ephemeris. Its accuracy is comparable to the 10-point Lagrange interpolation, 
+    while only the first and last records of the CPF ephemeris are outside the interpolation range.
+
+    Usage:
+        positions = hermite_ephem(ts_quasi_mjd,ts_quasi_mjd_cpf,positions_cpf,velocities_cpf)
+        positions,velocities,accelerations = hermite_ephem(ts_quasi_mjd,ts_quasi_mjd_cpf,positions_cpf,velocities_cpf,derivatives=2)
+
+    Inputs:
+        ts_quasi_mjd -> [float array] quasi MJD for interpolated prediction, as defined in interp_ephem, or any other time argument such as the integer nanoseconds of interp_epochs
+        ts_quasi_mjd_cpf -> [float array] quasi MJD for CPF ephemeris
+        positions_cpf -> [2d float array] target positions in cartesian coordinates in meters w.r.t. ITRF for CPF ephemeris
+        velocities_cpf -> [2d float array] target velocities for CPF ephemeris as the derivatives with respect to the time argument, such as in meters per day for quasi MJD
+
+    Parameters:
+        derivatives -> [int, default = 0] highest order of the time derivatives of the interpolating polynomial to return, which is 0, 1 or 2.
+
+    Outputs:
+        positions -> [2d float array] target positions in cartesian coordinates in meters w.r.t. ITRF for interpolated prediction.
+        velocities -> [2d float array] first derivatives of positions with respect to the time argument. Only returned if derivatives >= 1.
+        accelerations -> [2d float array] second derivatives of positions with respect to the time argument. Only returned if derivatives == 2.
+    """
+    ts_quasi_mjd, ts_quasi_mjd_cpf = time_arrays(ts_quasi_mjd, ts_quasi_mjd_cpf)
+    n = len(ts_quasi_mjd_cpf)
+    if n < 4:
+        raise ValueError('At least 4 position records are required for the interpolation')
+
+    order, ts_quasi_mjd, starts, windows, inverse = window_groups(ts_quasi_mjd, ts_quasi_mjd_cpf, 4)
+    nodes = np.arange(4)
+    powers = np.arange(8)
+
+    # The coefficients of the polynomial are solved once for each window in use, in the local time scaled to unit spacing around the center of the window.
+    # Times are first taken relative to the first node of the window, which is exact on an integer time axis.
+    ts_window = ts_quasi_mjd_cpf[windows[:, None] + nodes]
+    spacing = (ts_window[:, 3] - ts_window[:, 0])/3
+    s = (ts_window - ts_window[:, :1])/spacing[:, None] - 1.5
+
+    # Confluent Vandermonde system with rows for the values and the first derivatives at the nodes
+    matrix = np.empty((len(windows), 8, 8))
+    matrix[:, :4] = s[:, :, None]**powers
+    matrix[:, 4:, 0] = 0
+    matrix[:, 4:, 1:] = powers[1:]*s[:, :, None]**powers[:-1]
+    values = np.concatenate((positions_cpf[windows[:, None] + nodes], velocities_cpf[windows[:, None] + nodes]*spacing[:, None, None]), axis=1)
+    # Coefficients are gathered for the epochs with the powers along the first axis, so that each step of the evaluation reads contiguous memory
+    coefficients = np.linalg.solve(matrix, values).transpose(1, 0, 2)[:, inverse]
+
+    # Horner's scheme for the polynomial and its derivatives
+    x = ((ts_quasi_mjd - ts_window[inverse, 0])/spacing[inverse] - 1.5)[:, None]
+    results = [coefficients[7]] + [np.zeros((len(x), 3)) for m in range(derivatives)]
+    for k in range(6, -1, -1):
+        for m in range(derivatives, 0, -1):
+            results[m] = results[m]*x + results[m-1]
+        results[0] = results[0]*x + coefficients[k]
+    for m in range(1, derivatives + 1):
+        # Horner's scheme gives the Taylor coefficients, which are scaled to the derivatives with respect to the time argument
+        results[m] = results[m]*np.prod(np.arange(1, m + 1))/spacing[inverse, None]**m
+
+    return scatter_results(order, results[:derivatives + 1])
+
+
+def time_arrays(ts_quasi_mjd, ts_quasi_mjd_cpf):
+    """
+    Convert the time arguments of the epochs and the records to arrays, keeping integer time axes as int64 and converting others to float.
+    """
+    ts_quasi_mjd, ts_quasi_mjd_cpf = np.asarray(ts_quasi_mjd), np.asarray(ts_quasi_mjd_cpf)
+    if ts_quasi_mjd.dtype.kind in 'iu' and ts_quasi_mjd_cpf.dtype.kind in 'iu':
+        return ts_quasi_mjd.astype(np.int64), ts_quasi_mjd_cpf.astype(np.int64)
+    return ts_quasi_mjd.astype(float), ts_quasi_mjd_cpf.astype(float)
+
+
+def window_groups(ts_quasi_mjd, ts_quasi_mjd_cpf, n_nodes):
+    """
+    Assign the epochs to the interpolation windows of the CPF ephemeris in one pass, and group the epochs by window.
+    The epochs are sorted if they are not in ascending order, such as scattered ranging epochs, so that the epochs sharing a window are contiguous;
+    the window of an epoch starts n_nodes//2 - 1 records before the last record on or before the epoch, and is shifted inwards at both ends of the CPF ephemeris.
+
+    Usage:
+        order, ts_quasi_mjd, starts, windows, inverse = window_groups(ts_quasi_mjd, ts_quasi_mjd_cpf, 10)
+
+    Inputs:
+        ts_quasi_mjd -> [float array] quasi MJD for interpolated prediction
+        ts_quasi_mjd_cpf -> [float array] quasi MJD for CPF ephemeris
+        n_nodes -> [int] number of records in the interpolation windows
+
+    Outputs:
+        order -> [int array or None] indices that sort the epochs; None if the epochs are already in ascending order
+        ts_quasi_mjd -> [float array] quasi MJD for interpolated prediction in ascending order
+        starts -> [int array] index of the first record of the window for each epoch
+        windows -> [int array] index of the first record of each window in use
+        inverse -> [int array] index into windows for each epoch
+    """
+    order = None
+    if (np.diff(ts_quasi_mjd) < 0).any():
+        order = np.argsort(ts_quasi_mjd, kind='stable')
+        ts_quasi_mjd = ts_quasi_mjd[order]
+
+    index = None
+    if ts_quasi_mjd_cpf.dtype.kind == 'i' and len(ts_quasi_mjd_cpf) > 1:
+        # On a uniform integer grid, the last record on or before an epoch is found by exact integer division
+        step = ts_quasi_mjd_cpf[1] - ts_quasi_mjd_cpf[0]
+        if step > 0 and (np.diff(ts_quasi_mjd_cpf) == step).all():
+            index = np.clip((ts_quasi_mjd - ts_quasi_mjd_cpf[0])//step, -1, len(ts_quasi_mjd_cpf) - 1)
+    if index is None:
+        index = np.searchsorted(ts_quasi_mjd_cpf, ts_quasi_mjd, side='right') - 1
+    starts = np.clip(index - (n_nodes//2 - 1), 0, len(ts_quasi_mjd_cpf) - n_nodes)
+    windows, inverse = group_windows(starts)
+
+    return order, ts_quasi_mjd, starts, windows, inverse
+
+
+def group_windows(starts):
+    """
+    Group the epochs by window, given the index of the first record of the window for each epoch in non-decreasing order.
+    The groups are then the runs of equal starts.
+
+    Usage:
+        windows, inverse = group_windows(starts)
+
+    Inputs:
+        starts -> [int array] index of the first record of the window for each epoch, in non-decreasing order
+
+    Outputs:
+        windows -> [int array] index of the first record of each window in use
+        inverse -> [int array] index into windows for each epoch
+    """
+    new_window = np.concatenate(([True], starts[1:] != starts[:-1])) if len(starts) else np.zeros(0, dtype=bool)
+    windows = starts[new_window]
+    inverse = np.cumsum(new_window) - 1
+    return windows, inverse
+
+
+def scatter_results(order, results):
+    """
+    Put the interpolated results of the sorted epochs back in the order of the epochs as given, as the outputs of interp_ephem and hermite_ephem.
+    """
+    if order is not None:
+        scattered = []
+        for result in results:
+            unsorted = np.empty_like(result)
+            unsorted[order] = result
+            scattered.append(unsorted)
+        results = scattered
+    if len(results) == 1: return results[0]
+    return tuple(results)
+
+
+def interp_ephem(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf, derivatives=0):
     """
     Interpolate the CPF ephemeris using the 10-point(degree 9) Lagrange polynomial interpolation method. 
+    For each epoch, the window of 10 CPF records is located by binary search, starting 4 records before the last record on or before the epoch,
+    and shifted inwards at both ends of the CPF ephemeris. The epochs are grouped by window, so the barycentric weights of the nodes are computed once per window,
+    and all epochs are then evaluated at once as products of the Lagrange weights and the records in their windows. The epochs need not be in ascending order.
 
     Usage: 
         positions = interp_ephem(ts_quasi_mjd,ts_quasi_mjd_cpf,positions_cpf)
+        positions,velocities,accelerations = interp_ephem(ts_quasi_mjd,ts_quasi_mjd_cpf,positions_cpf,derivatives=2)
 
     Inputs:
         Here, the quasi MJD is defined as int(MJD) + (SoD + Leap Second)/86400, which is different from the conventional MJD defination.
@@ -240,98 +710,358 @@ def interp_ephem(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf):
         ts_quasi_mjd -> [float array] quasi MJD for interpolated prediction
         ts_quasi_mjd_cpf -> [float array] quasi MJD for CPF ephemeris
         positions_cpf -> [2d float array] target positions in cartesian coordinates in meters w.r.t. ITRF for CPF ephemeris. 
+        Other time arguments, such as the integer nanoseconds with the leap second folded in as used by interp_epochs, are interpolated alike; 
+        integer arrays are kept as they are, so that the differences between the epochs and the records are exact.
+
+    Parameters:
+        derivatives -> [int, default = 0] highest order of the time derivatives of the interpolating polynomial to return, which is 0, 1 or 2.
 
     Outputs:
         positions -> [2d float array] target positions in cartesian coordinates in meters w.r.t. ITRF for interpolated prediction.
+        velocities -> [2d float array] first derivatives of positions with respect to the time argument, that is, in meters per day for quasi MJD. Only returned if derivatives >= 1.
+        accelerations -> [2d float array] second derivatives of positions with respect to the time argument. Only returned if derivatives == 2.
     """
-    positions = []
-
-    m = len(ts_quasi_mjd)
+    ts_quasi_mjd, ts_quasi_mjd_cpf = time_arrays(ts_quasi_mjd, ts_quasi_mjd_cpf)
     n = len(ts_quasi_mjd_cpf)
+    if n < 10:
+        raise ValueError('At least 10 position records are required for the interpolation')
 
-    if m > n:
-        for i in range(n-1):
-            flags = (ts_quasi_mjd >= ts_quasi_mjd_cpf[i]) & (
-                ts_quasi_mjd < ts_quasi_mjd_cpf[i+1])
-            if flags.any():
-                positions.append(BarycentricInterpolator(
-                    ts_quasi_mjd_cpf[i-4:i+6], positions_cpf[i-4:i+6])(ts_quasi_mjd[flags]))
-        positions = np.concatenate(positions)
-    else:
-        for j in range(m):
-            boundary = np.diff(
-                ts_quasi_mjd[j] >= ts_quasi_mjd_cpf).nonzero()[0][0]
-            if ts_quasi_mjd[j] in ts_quasi_mjd_cpf:
-                positions.append(positions_cpf[boundary])
-            else:
-                positions.append(BarycentricInterpolator(
-                    ts_quasi_mjd_cpf[boundary-4:boundary+6], positions_cpf[boundary-4:boundary+6])(ts_quasi_mjd[j]))
-        positions = np.array(positions)
+    order, ts_quasi_mjd, starts, windows, inverse = window_groups(ts_quasi_mjd, ts_quasi_mjd_cpf, 10)
+    results = lagrange_windows(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf, starts, windows, inverse, derivatives)
 
-    return positions
+    return scatter_results(order, results)
 
 
-def itrs2horizon(station, ts, positions, coord_type):
+def lagrange_windows(ts_quasi_mjd, ts_quasi_mjd_cpf, positions_cpf, starts, windows, inverse, derivatives=0):
+    """
+    Evaluate the 10-point Lagrange interpolation of the CPF ephemeris for epochs that are assigned to windows, as the core of interp_ephem.
+
+    Usage:
+        results = lagrange_windows(ts_quasi_mjd,ts_quasi_mjd_cpf,positions_cpf,starts,windows,inverse)
+
+    Inputs:
+        ts_quasi_mjd -> [float array] quasi MJD for interpolated prediction
+        ts_quasi_mjd_cpf -> [float array] quasi MJD for CPF ephemeris
+        positions_cpf -> [2d float array] target positions in cartesian coordinates in meters for CPF ephemeris
+        starts -> [int array] index of the first record of the window for each epoch
+        windows -> [int array] index of the first record of each window in use
+        inverse -> [int array] index into windows for each epoch
+
+    Parameters:
+        derivatives -> [int, default = 0] highest order of the time derivatives to evaluate, which is 0, 1 or 2.
+
+    Outputs:
+        results -> [list of 2d float array] positions, followed by the velocities and accelerations if requested, as in interp_ephem
+    """
+    nodes = np.arange(10)
+
+    # The barycentric weights are computed once for each window in use, with the differences of nodes scaled to unit spacing
+    ts_window = ts_quasi_mjd_cpf[windows[:, None] + nodes]
+    spacing = (ts_window[:, 9] - ts_window[:, 0])/9
+    differences = (ts_window[:, :, None] - ts_window[:, None, :])/spacing[:, None, None]
+    differences[:, nodes, nodes] = 1
+    barycentric_weights = 1/differences.prod(axis=2)
+
+    # Lagrange weights of the epochs in the second(true) form of the barycentric formula, which are normalized to sum to one
+    d = (ts_quasi_mjd[:, None] - ts_quasi_mjd_cpf[starts[:, None] + nodes])/spacing[inverse, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = barycentric_weights[inverse]/d
+        weights /= weights.sum(axis=1, keepdims=True)
+
+    positions_window = positions_cpf[starts[:, None] + nodes]
+    positions = np.einsum('ij,ijk->ik', weights, positions_window)
+
+    # Derivatives of the same polynomial by the barycentric formulas for divided differences(Schneider and Werner, 1986):
+    # p'(t) = sum(w_j*q_j)/sum(w_j) and p''(t) = 2*sum(w_j*(p'(t) - q_j)/(t - t_j))/sum(w_j), where q_j = (p(t) - p_j)/(t - t_j)
+    results = [positions]
+    if derivatives >= 1:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            q = (positions[:, None] - positions_window)/d[:, :, None]
+            velocities = np.einsum('ij,ijk->ik', weights, q)
+            results.append(velocities/spacing[inverse, None])
+            if derivatives >= 2:
+                accelerations = 2*np.einsum('ij,ijk->ik', weights, (velocities[:, None] - q)/d[:, :, None])
+                results.append(accelerations/spacing[inverse, None]**2)
+
+    # Epochs that coincide with CPF records take the records as they are
+    hits, columns = np.nonzero(d == 0)
+    positions[hits] = positions_cpf[starts[hits] + columns]
+
+    # Near the records, the divided differences above lose precision by cancellation, so the derivatives are expanded from those at the nearest record,
+    # which are obtained from the differentiation matrix of the window
+    if derivatives >= 1:
+        near, columns = np.nonzero(np.abs(d) < 1e-3)
+        if len(near):
+            window = inverse[near]
+            w = barycentric_weights[window]
+            matrix = w[:, None, :]/w[:, :, None]/differences[window]
+            matrix[:, nodes, nodes] = 0
+            matrix[:, nodes, nodes] = -matrix.sum(axis=2)
+            delta = d[near, columns][:, None]
+            rows = [matrix[np.arange(len(near)), columns]]
+            for m in range(2):
+                rows.append(np.einsum('ij,ijk->ik', rows[-1], matrix))
+            v, a, j = [np.einsum('ij,ijk->ik', row, positions_window[near]) for row in rows]
+            results[1][near] = (v + a*delta + j*delta**2/2)/spacing[window, None]
+            if derivatives >= 2:
+                results[2][near] = (a + j*delta)/spacing[window, None]**2
+
+    return results
+
+
+def itrs2horizon(station, ts, positions, coord_type, engine='native', polar_motion=False):
     """
     Convert cartesian coordinates of targets in ITRF to spherical coordinates in topocentric reference frame for a specific station.
 
     Usage: 
-        az,alt,rho = itrs2horizon(station,ts,ts_quasi_mjd,positions,coord_type)
+        az,alt,rho = itrs2horizon(station,ts,positions,coord_type)
+        az,alt,rho = itrs2horizon(station,ts,positions,coord_type,polar_motion=True)
+        az,alt,rho = itrs2horizon(station,ts,positions,coord_type,engine='astropy')
 
     Inputs:
         station -> [numercial array or list with 3 elements] coordinates of station. It can either be geocentric(x, y, z) coordinates or geodetic(lon, lat, height) coordinates.
         Unit for (x, y, z) are meter, and for (lon, lat, height) are degree and meter.
-        ts -> [str array] isot-formatted UTC for interpolated prediction
+        ts -> [str array or object of class Astropy Time] UTC for interpolated prediction; only used by the astropy engine and the polar motion correction
         positions -> [2d float array] target positions in cartesian coordinates in meters w.r.t. ITRF for interpolated prediction.
         coord_type -> [str] coordinates type for coordinates of station; it can either be 'geocentric' or 'geodetic'.
 
+    Parameters:
+        engine -> [str, default = 'native'] 'native' to resolve the vectors from the station to the targets in the local east, north and up directions by one rotation,
+        or 'astropy' to transform through the celestial frames of astropy for cross-checking. The latter treats the targets like celestial sources and applies the aberration,
+        which shifts near-Earth targets by up to about 100 arcseconds and several hundred meters in range.
+        polar_motion -> [bool, default = False] for the native engine, whether to refer the azimuth and altitude to the Celestial Intermediate Pole instead of the pole of ITRF
+
     Outputs:
         az -> [float array] Azimuth for interpolated prediction in degrees
         alt -> [float array] Altitude for interpolated prediction in degrees
         rho -> [float array] Range for interpolated prediction in meters
     """
+    if engine == 'astropy':
+        if coord_type == 'geocentric':
+            x, y, z = station
+            site = EarthLocation.from_geocentric(x, y, z, unit='m')
+        elif coord_type == 'geodetic':
+            lat, lon, height = station
+            site = EarthLocation.from_geodetic(lon, lat, height)
+
+        coords = SkyCoord(positions, unit='m',
+                          representation_type='cartesian', frame='itrs', obstime=Time(ts))
+        horizon = coords.transform_to(AltAz(obstime=Time(ts), location=site))
+
+        az, alt, rho = horizon.az.deg, horizon.alt.deg, horizon.distance.m
+
+        return az, alt, rho
+    elif engine != 'native':
+        raise Exception("Engine must be 'native' or 'astropy'.")
+
+    site_xyz, lon, lat = station_geodetic(station, coord_type)
+    vectors = positions - site_xyz
+    if polar_motion:
+        # From ITRF to the terrestrial intermediate reference system, whose pole is the Celestial Intermediate Pole
+        vectors = np.einsum('nji,nj->ni', polar_motion_matrix(Time(ts)), vectors)
+
+    return enu2azalt(vectors @ enu_matrix(lon, lat).T)
+
+
+def enu_matrix(lon, lat):
+    """
+    Rotation matrices from ITRF to the local east, north and up directions of stations.
+
+    Usage:
+        enu = enu_matrix(lon, lat)
+
+    Inputs:
+        lon -> [float or float array] geodetic longitude of stations in radians
+        lat -> [float or float array] geodetic latitude of stations in radians
+
+    Outputs:
+        enu -> [float array] rotation matrices with the east, north and up directions in ITRF as rows, with shape of (3, 3) for one station, or (number of stations, 3, 3)
+    """
+    sin_lon, cos_lon, sin_lat, cos_lat = np.sin(lon), np.cos(lon), np.sin(lat), np.cos(lat)
+    rows = [[-sin_lon, cos_lon, np.zeros_like(sin_lon)],
+            [-sin_lat*cos_lon, -sin_lat*sin_lon, cos_lat],
+            [cos_lat*cos_lon, cos_lat*sin_lon, sin_lat]]
+    return np.stack([np.stack(row, axis=-1) for row in rows], axis=-2)
+
+
+def enu2azalt(enu):
+    """
+    Convert vectors in the local east, north and up directions to azimuth, altitude and range.
+
+    Usage:
+        az, alt, rho = enu2azalt(enu)
+
+    Inputs:
+        enu -> [float array] vectors with the east, north and up components on the last axis in meters
+
+    Outputs:
+        az -> [float array] Azimuth in degrees, from north towards east in [0, 360)
+        alt -> [float array] Altitude in degrees
+        rho -> [float array] Range in meters
+    """
+    east, north, up = enu[..., 0], enu[..., 1], enu[..., 2]
+    horizontal = np.hypot(east, north)
+    az = np.rad2deg(np.arctan2(east, north)) % 360
+    alt = np.rad2deg(np.arctan2(up, horizontal))
+    return az, alt, np.hypot(horizontal, up)
+
+
+def polar_motion_matrix(ts):
+    """
+    Polar motion matrices from the terrestrial intermediate reference system to ITRF, with the pole coordinates taken from the IERS table loaded by astropy.
+
+    Usage:
+        w = polar_motion_matrix(ts)
+
+    Inputs:
+        ts -> [object of class Astropy Time] epochs
+
+    Outputs:
+        w -> [3d float array] rotation matrices with shape of (number of epochs, 3, 3)
+    """
+    from astropy.utils import iers
+
+    ts = Time(ts).ravel()
+    xp, yp = iers.earth_orientation_table.get().pm_xy(ts)
+    sp = erfa.sp00(ts.tt.jd1, ts.tt.jd2)
+    return erfa.pom00(xp.to_value(u.rad), yp.to_value(u.rad), sp)
+
+
+def station_geodetic(station, coord_type):
+    """
+    Resolve the coordinates of a station to both geocentric coordinates and geodetic longitude and latitude, as interpreted by itrs2horizon.
+
+    Usage:
+        site_xyz, lon, lat = station_geodetic(station, coord_type)
+
+    Inputs:
+        station -> [numercial array or list with 3 elements] coordinates of station. It can either be geocentric(x, y, z) coordinates or geodetic(lon, lat, height) coordinates.
+        Unit for (x, y, z) are meter, and for (lon, lat, height) are degree and meter.
+        coord_type -> [str] coordinates type for coordinates of station; it can either be 'geocentric' or 'geodetic'.
+
+    Outputs:
+        site_xyz -> [float array] geocentric coordinates of station in meters w.r.t. ITRF
+        lon -> [float] geodetic longitude of station in radians
+        lat -> [float] geodetic latitude of station in radians
+    """
     if coord_type == 'geocentric':
         x, y, z = station
         site = EarthLocation.from_geocentric(x, y, z, unit='m')
     elif coord_type == 'geodetic':
         lat, lon, height = station
         site = EarthLocation.from_geodetic(lon, lat, height)
+    else:
+        raise Exception("Coordinates type must be 'geocentric' or 'geodetic'.")
 
-    coords = SkyCoord(positions, unit='m',
-                      representation_type='cartesian', frame='itrs', obstime=Time(ts))
-    horizon = coords.transform_to(AltAz(obstime=Time(ts), location=site))
-
-    az, alt, rho = horizon.az.deg, horizon.alt.deg, horizon.distance.m
-
-    return az, alt, rho
+    site_xyz = np.array([site.x.to_value(u.m), site.y.to_value(u.m), site.z.to_value(u.m)])
+    return site_xyz, site.lon.to_value(u.rad), site.lat.to_value(u.rad)
 
 
-def itrs2gcrf(ts, positions):
+def itrs2gcrf(ts, positions, engine='cached'):
     """
     Convert cartesian coordinates of targets in ITRF to GCRF.
 
     Usage: 
-        x,y,z = itrs2horizon(station,ts,ts_quasi_mjd,positions,coord_type)
+        x,y,z = itrs2gcrf(ts,positions)
+        x,y,z = itrs2gcrf(ts,positions,engine='astropy')
 
     Inputs:
         ts -> [str array] isot-formatted UTC for interpolated prediction
         positions -> [2d float array] target positions in cartesian coordinates in meters w.r.t. ITRF for interpolated prediction.
 
+    Parameters:
+        engine -> [str or object, default = 'cached'] source of the rotation; see itrs2gcrf_rotation
+
     Outputs:
         x -> [float array] Coordinate x for interpolated prediction in [m]
         y -> [float array] Coordinate y for interpolated prediction in [m]
         z -> [float array] Coordinate z for interpolated prediction in [m]
     """
-    coords = SkyCoord(positions, unit='m',
-                      representation_type='cartesian', frame='itrs', obstime=Time(ts))
-    x, y, z = coords.gcrs.cartesian.xyz.value
+    if engine == 'astropy':
+        coords = SkyCoord(positions, unit='m',
+                          representation_type='cartesian', frame='itrs', obstime=Time(ts))
+        x, y, z = coords.gcrs.cartesian.xyz.value
+    else:
+        x, y, z = np.einsum('ijk,ik->ji', itrs2gcrf_rotation(ts, engine), positions)
 
     return x, y, z
 
 
+def itrs2gcrf_derivatives(ts, positions, velocities, accelerations=None, engine='cached'):
+    """
+    Convert cartesian coordinates, velocities and accelerations of targets in ITRF to GCRF.
+
+    Usage:
+        positions_gcrf,velocities_gcrf = itrs2gcrf_derivatives(ts,positions,velocities)
+        positions_gcrf,velocities_gcrf,accelerations_gcrf = itrs2gcrf_derivatives(ts,positions,velocities,accelerations)
+
+    Inputs:
+        ts -> [object of class Astropy Time] UTC for interpolated prediction
+        positions -> [2d float array] target positions in cartesian coordinates in meters w.r.t. ITRF
+        velocities -> [2d float array] target velocities in meters per second w.r.t. ITRF
+
+    Parameters:
+        accelerations -> [2d float array, default = None] target accelerations in meters per second squared w.r.t. ITRF
+        engine -> [str or object, default = 'cached'] source of the rotation; see itrs2gcrf_rotation
+
+    Outputs:
+        positions_gcrf -> [2d float array] target positions in cartesian coordinates in meters w.r.t. GCRF
+        velocities_gcrf -> [2d float array] target velocities in meters per second w.r.t. GCRF
+        accelerations_gcrf -> [2d float array] target accelerations in meters per second squared w.r.t. GCRF; only returned if accelerations are given
+
+    Note: The rotation rate of the Earth is taken as constant along the pole of ITRF, and the slow variations of precession, nutation and polar motion are ignored.
+    """
+    rotation = itrs2gcrf_rotation(ts, engine)
+
+    # Transport theorem, with the angular velocity of the Earth w.r.t. ITRF
+    omega = np.array([0, 0, 7.292115146706979e-5])
+    w_r = np.cross(omega, positions)
+    results = [positions, velocities + w_r]
+    if accelerations is not None:
+        results.append(accelerations + 2*np.cross(omega, velocities) + np.cross(omega, w_r))
+
+    return tuple(np.einsum('ijk,ik->ij', rotation, result) for result in results)
+
+
+def itrs2gcrf_rotation(ts, engine='cached'):
+    """
+    Calculate the rotation matrices from ITRF to GCRF.
+
+    Usage:
+        rotation = itrs2gcrf_rotation(ts)
+        rotation = itrs2gcrf_rotation(ts,engine='astropy')
+        rotation = itrs2gcrf_rotation(ts,engine=EarthOrientation(step=600,tolerance=1e-11))
+
+    Inputs:
+        ts -> [object of class Astropy Time] UTC epochs
+
+    Parameters:
+        engine -> [str or object, default = 'cached'] 'cached' for the default instance of class EarthOrientation, which interpolates the precession-nutation and polar motion
+        from cached nodes and evaluates the Earth rotation angle at every epoch, an instance of class EarthOrientation with its own node spacing and tolerance,
+        or 'astropy' for the full transformation of the basis vectors by astropy at every epoch, as a reference
+
+    Outputs:
+        rotation -> [3d float array] rotation matrices with shape of (number of epochs, 3, 3), such that positions_gcrf = rotation @ positions_itrf
+    """
+    ts = Time(ts)
+    if engine == 'cached':
+        return EARTH_ORIENTATION.rotation(ts)
+    elif isinstance(engine, EarthOrientation):
+        return engine.rotation(ts)
+    elif engine != 'astropy':
+        raise Exception("Engine must be 'cached', 'astropy' or an instance of class EarthOrientation.")
+
+    # The columns are the ITRF basis vectors expressed in GCRF, with the basis vectors broadcast against the epochs
+    scale = 1e7
+    basis = np.broadcast_to(scale*np.eye(3)[:, :, None], (3, 3, ts.size))
+    coords = SkyCoord(*basis, unit='m', representation_type='cartesian', frame='itrs', obstime=ts.ravel())
+    return coords.gcrs.cartesian.xyz.value.transpose(2, 0, 1)/scale
+
+
 def iso2sod(ts):
     """
     Calculate the Second of Day from the isot-formatted UTC time sets.
+    For epochs given as an Astropy Time object, time2mjdsod computes MJD and Second of Day numerically without formatting the strings.
 
     Usage: 
         sods = iso2sod(ts)
@@ -367,11 +1097,16 @@ def t_list(t_start, t_end, t_step):
     return t
 
 
-def next_pass_horizon(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, t_start, t_end, t_step, station, coord_type, cutoff):
+def next_pass_horizon(ephemeris, *args, method='lagrange', engine='native', polar_motion=False):
     """
     Generate passes prediction for space targets viewed from a ground-based station.
 
+    Usage:
+        passes = next_pass_horizon(ephemeris,t_start,t_end,t_step,station,coord_type,cutoff)
+        passes = next_pass_horizon(ts_utc_cpf,ts_mjd_cpf,ts_sod_cpf,leap_second_cpf,positions_cpf,t_start,t_end,t_step,station,coord_type,cutoff)
+
     Inputs:
+        ephemeris -> [object] instance of class CPFEphemeris as returned by read_cpf; alternatively, the CPF ephemeris can be given by the following 5 arrays.
         ts_utc_cpf -> [str array] iso-formatted UTC for CPF ephemeris 
         ts_mjd_cpf -> [int array] MJD for CPF ephemeris 
         ts_sod_cpf -> [float array] Second of Day for CPF ephemeris 
@@ -385,12 +1120,19 @@ def next_pass_horizon(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, posit
         coord_type -> [str] coordinates type for coordinates of station; it can either be 'geocentric' or 'geodetic'.
         cutoff -> [float] altitude cut-off angle
 
+    Parameters:
+        method -> [str, default = 'lagrange'] interpolation method, 'lagrange' or 'hermite'; see cpf_interp_azalt
+        engine -> [str, default = 'native'] transformation to the topocentric reference frame, 'native' or 'astropy'; see cpf_interp_azalt
+        polar_motion -> [bool, default = False] whether the native engine refers the altitude to the Celestial Intermediate Pole; see cpf_interp_azalt
+
     Outputs:
         passes -> [2d array] Time table of passes in UTC
     """
+    ephemeris, (t_start, t_end, t_step, station, coord_type, cutoff) = ephemeris_args(ephemeris, args, 6)
+
     mode = 'geometric'
     ts, ts_mjd, ts_sod, az, alt, r, tof1 = cpf_interp_azalt(
-        ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, t_start, t_end, t_step, mode, station, coord_type)
+        ephemeris, t_start, t_end, t_step, mode, station, coord_type, method=method, engine=engine, polar_motion=polar_motion)
 
     sat_above_horizon = alt > cutoff
     # Find the index of jump nodes between sat_above_horizon and sat_under_horizon
@@ -409,8 +1151,8 @@ def next_pass_horizon(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, posit
     if len(nodes) % 2 != 0:
         nodes = np.append(nodes, len(sat_above_horizon)-1)
 
-    t = t_list(Time(t_start), Time(t_end), t_step)
-    boundaries = t[nodes].isot.reshape(len(nodes) // 2, 2)
+    grid = TimeGrid.from_range(t_start, t_end, t_step)
+    boundaries = grid.isot(nodes).reshape(len(nodes) // 2, 2)
     seconds = TimeDelta(np.arange(t_step+1), format='sec')
 
     # Compute the time moment of rise and set accurately with an uncertainty less than one second.
@@ -418,14 +1160,14 @@ def next_pass_horizon(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, posit
         t_start_rise = Time(rises)
         t_end_rise = t_start_rise + seconds[-1]
         ts, ts_mjd, ts_sod, az, alt, r, tof1 = cpf_interp_azalt(
-            ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, t_start_rise, t_end_rise, 1, mode, station, coord_type)
+            ephemeris, t_start_rise, t_end_rise, 1, mode, station, coord_type, method=method, engine=engine, polar_motion=polar_motion)
         sat_above_horizon = alt > cutoff
         pass_rise = t_start_rise + seconds[sat_above_horizon][0]
 
         t_start_set = Time(sets)
         t_end_set = t_start_set + seconds[-1]
         ts, ts_mjd, ts_sod, az, alt, r, tof1 = cpf_interp_azalt(
-            ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, t_start_set, t_end_set, 1, mode, station, coord_type)
+            ephemeris, t_start_set, t_end_set, 1, mode, station, coord_type, method=method, engine=engine, polar_motion=polar_motion)
         sat_above_horizon = alt > cutoff
 
         if sat_above_horizon[-1]:
@@ -1,107 +1,409 @@
+from itertools import islice
+from warnings import warn
+
 import numpy as np
-from astropy.time import Time,TimeDelta
+from numpy.lib.stride_tricks import as_strided
+
+from .cpf_time import date2mjd,mjdsod2iso
+from .cpf_cache import load_cache,save_cache,pack_cpf
+from .cpf_compress import open_cpf,decompress
+from ..slrclasses.cpfephemeris import CPFEphemeris
 
-def read_cpf(cpf_dir,cpf_file):
+def read_cpf(cpf_dir,cpf_file,cache=True,cache_dir=None,headers_only=False):
     """
     Parse a single CPF ephemeris file and read the data.
 
-    Usage: 
+    Usage:
         data = read_cpf(cpf_dir,cpf_file)
+        data = read_cpf(cpf_dir,cpf_file,cache=False)
+        data = read_cpf(cpf_dir,cpf_file,headers_only=True)
 
     Inputs:
         cpf_dir -> [str] Directory for storing CPF ephemeris files
-        cpf_file -> [str] name of the CPF ephemeris file, such as 'ajisai_cpf_170829_7411.hts'
+        cpf_file -> [str] name of the CPF ephemeris file, such as 'ajisai_cpf_170829_7411.hts'.
+        Files compressed by gzip, bzip2, xz or Unix compress, such as 'ajisai_cpf_170829_7411.hts.gz', are decompressed in memory.
+
+    Parameters:
+        cache -> [bool, default = True] whether to use the binary cache of parsed CPF ephemeris files.
+        If True, the parsed data is loaded from the cache if the file is unchanged since it was cached, and saved to the cache otherwise.
+        cache_dir -> [str, default = None] directory for storing the cache files. If None, '~/src/cpf_cache/' is used.
+        headers_only -> [bool, default = False] If True, only the header records are parsed, and the file is read no further than the first data record.
+        In this case, the outputs contain the header information only, and the arrays of position records are empty.
 
     Outputs:
-        data -> [dictionary] a python dictionary containing the main information of the CPF ephemeris file. 
-        The information includes the following contents:
+        data -> [object] instance of class CPFEphemeris containing the main information of the CPF ephemeris file.
+        The header information is in data.header, which includes the following contents:
         (1) Format; (2) Format Version (3) Ephemeris Source (4) date of ephemeris production (5) Ephemeris Sequence number
         (6) Target name (7) COSPAR ID (8) SIC (9) NORAD ID (10) Starting date and time (11) Ending date and time
         (12) Time between table entries (UTC seconds) (13) Target type (14) Reference frame (15) Rotational angle type
-        (16) Center of mass correction (17) Direction type (18) Modified Julian Date (19) Seconds of Day (20) Leap_Second
-        (21) time in UTC (22) target positions in meters
-    """
-    cpf_data = open(cpf_dir+cpf_file,'r').readlines()
-    data = {'MJD':[],'SoD':[],'positions[m]':[],'Leap_Second':[]}
-    for line in cpf_data:
-        info = line.split()
-        if info[0] == 'H1':
-            data['Format'] = info[1]
-            data['Format Version'] = info[2]
-            data['Ephemeris Source'] = info[3]
-            data['Time of Ephemeris Production'] = Time('-'.join(info[4:7])+' '+':'.join([info[7],'0','0'])).iso
-            data['Ephemeris Sequence Number'] = info[8]
-            data['Target Name'] = info[9]
-        elif info[0] == 'H2':
-            data['COSPAR ID'] = info[1]
-            data['SIC'] = info[2]
-            data['NORAD ID'] = info[3]
-            data['Start'] = Time('-'.join(info[4:7])+' '+':'.join(info[7:10])).iso
-            data['End'] = Time('-'.join(info[10:13])+' '+':'.join(info[13:16])).iso
-            data['Time Interval[sec]'] = info[16]
-            
-            if info[17] == '1':
-                target_type = 'passive(retro-reflector) artificial satellite'
-            elif info[17] == '2':
-                target_type = 'passive(retro-reflector) lunar reflector'
-            elif info[17] == '3':
-                target_type = 'synchronous transponder'
-            elif info[17] == '4':
-                target_type = 'asynchronous transponder'
-            else:
-                raise Exception('Unknown target type')
-            data['Target Type'] = target_type   
-            
-            if info[19] == '0':
-                reference_frame = 'ITRF(default)'
-            elif info[19] == '1':
-                reference_frame = 'GCRF(True of Date)'
-            elif info[19] == '2':
-                reference_frame = 'GCRF(Mean of Date J2000.0)'
-            else:
-                raise Exception('Unknown reference frame type')
-            data['Reference Frame'] = reference_frame    
-            
-            if info[20] == '0':
-                rotational_angle = 'Not Applicable'
-            elif info[20] == '1':
-                rotational_angle = 'Lunar Euler angles: φ, θ, and ψ'
-            elif info[20] == '2':
-                rotational_angle = 'North pole Right Ascension and Declination, and angle to prime meridian (α0, δ0, and W)'
-            else:
-                raise Exception('Unknown rotational angle type')
-            data['Rotational Angle'] = rotational_angle   
-            
-            if info[21] == '0':
-                CM_correction = 'None applied. Prediction is for center of mass of target'
-            elif info[21] == '1':
-                CM_correction = 'Applied. Prediction is for retro-reflector array'
+        (16) Center of mass correction (17) Direction type
+        The position records are in the arrays data.mjd, data.sod, data.leap_second and data.positions(in meters), and the iso-formatted UTC in data.ts_utc.
+        The velocity records(type 20), if any, are in data.velocities(in meters per second), aligned with the position records.
+        The contents are also accessible with the keys of the former dictionary output, such as data['Target Name'], data['MJD'] and data['positions[m]'].
+    """
+    if headers_only: return CPFEphemeris(read_cpf_headers(cpf_dir+cpf_file))
+
+    with open(cpf_dir+cpf_file,'rb') as f:
+        raw = f.read()
+
+    # The cache is checked against the raw content, so that compressed files served from the cache are not decompressed
+    if cache:
+        data = load_cache(cpf_dir+cpf_file,raw,cache_dir)
+        if data is not None: return data
+
+    cpf_data = decompress(raw)
+
+    header = {}
+    for line in header_lines(cpf_data):
+        parse_header(header,line.split())
+
+    records = parse_records(cpf_data,'10',8)
+    if len(records) == 0:
+        raise Exception('No position records(type 10) found in {:s}'.format(cpf_file))
+    header['Direction'] = direction_type(records[-1,1])
+
+    # Each velocity record follows the position record of the same epoch
+    velocities = parse_records(cpf_data,'20',5)[:,2:5]
+    if len(velocities) and len(velocities) != len(records):
+        warn('Velocity records(type 20) do not match the position records in {:s}, and are ignored'.format(cpf_file))
+        velocities = None
+
+    data = CPFEphemeris(header,records[:,2],records[:,3],records[:,4],records[:,5:8],velocities)
+
+    if cache: save_cache(cpf_dir+cpf_file,raw,data,cache_dir)
+
+    return data
+
+def read_cpf_headers(cpf_path):
+    """
+    Parse the header records of a CPF ephemeris file, reading the file line by line and stopping at the first data record.
+
+    Usage:
+        data = read_cpf_headers(cpf_path)
+
+    Inputs:
+        cpf_path -> [str] path of the CPF ephemeris file
+
+    Outputs:
+        data -> [dictionary] header information of the CPF ephemeris file, as in the outputs of read_cpf without the ephemeris data
+    """
+    data = {}
+    with open_cpf(cpf_path) as f:
+        for line in f:
+            info = line.decode().split()
+            if not info: continue
+            if info[0].startswith('H'):
+                parse_header(data,info)
             else:
-                raise Exception('Unknown center of mass correction type')
-            data['Center of Mass Correction'] = CM_correction          
-
-        elif info[0] == '10':
-            direction_flag = info[1]
-            data['MJD'].append(info[2])  
-            data['SoD'].append(info[3])
-            data['Leap_Second'].append(info[4])
-            data['positions[m]'].append(info[5:8])
+                # The direction flag is taken from the first position record
+                if info[0] == '10': data['Direction'] = direction_type(int(info[1]))
+                break
+    return data
+
+def iter_cpf(cpf_dir,cpf_file,chunk_size=100000):
+    """
+    Parse a CPF ephemeris file as a stream of header records and chunks of position records, with memory bounded by the chunk size.
+    It is suitable for very large files, such as lunar predictions or concatenated multi-week predictions, that are not worth holding in memory as a whole.
+
+    Usage:
+        for record_type,content in iter_cpf(cpf_dir,cpf_file):
+            if record_type == '10': positions = content['positions[m]']
+
+    Inputs:
+        cpf_dir -> [str] Directory for storing CPF ephemeris files
+        cpf_file -> [str] name of the CPF ephemeris file, such as 'ajisai_cpf_170829_7411.hts'. Compressed files are decompressed on the fly.
+
+    Parameters:
+        chunk_size -> [int, default = 100000] maximum number of data lines read at a time
+
+    Outputs:
+        generator of (record_type, content) in order of appearance in the file, where
+        (1) for a header record, record_type is 'H1', 'H2', ..., and content is a dictionary of its information as in the outputs of read_cpf;
+        (2) for a chunk of position records, record_type is '10', and content is a dictionary with keys 'MJD', 'SoD', 'Leap_Second' and 'positions[m]'.
+        Header records within the data part, such as the end-of-ephemeris record H9, are generated after the chunk that contains them.
+    """
+    with open_cpf(cpf_dir+cpf_file) as f:
+        # The header part is parsed line by line
+        for line in f:
+            info = line.decode().split()
+            if not info: continue
+            if not info[0].startswith('H'): break
+            header = {}
+            parse_header(header,info)
+            yield info[0],header
         else:
-            pass
-        
-    if direction_flag == '0':
+            return
+
+        lines = [line]
+        while True:
+            lines.extend(islice(f,chunk_size - len(lines)))
+            if not lines: break
+            block = b''.join(lines)
+            lines = []
+
+            records = parse_records(block,'10',8)
+            if len(records):
+                yield '10',{'MJD':records[:,2].astype(int),'SoD':records[:,3].copy(),
+                            'Leap_Second':records[:,4].astype(int),'positions[m]':records[:,5:8].copy()}
+            for line in header_lines(block):
+                info = line.split()
+                header = {}
+                parse_header(header,info)
+                yield info[0],header
+
+def direction_type(direction_flag):
+    """
+    Describe the direction flag of a position record.
+    """
+    if direction_flag == 0:
         direction = 'instantaneous vector from geocenter to target, without light-time iteration'
-    elif direction_flag == '1':
+    elif direction_flag == 1:
         direction = 'position vector from geocenter to target with light-time iteration at the transmit epoch'
-    elif direction_flag == '2':
+    elif direction_flag == 2:
         direction = 'position vector from target to geocenter with light-time iteration at the receive epoch'
     else:
         raise Exception('Unknown direction flag')
-    data['Direction'] = direction
-            
-    data['MJD'],data['SoD'] = np.array(data['MJD'],dtype = int),np.array(data['SoD'],dtype = float)
-    data['Leap_Second'] = np.array(data['Leap_Second'],dtype = int)
-    data['positions[m]'] = np.array(data['positions[m]'],dtype = float)
-    data['ts_utc'] = (Time(data['MJD'],format = 'mjd') + TimeDelta(data['SoD'],format='sec')).iso
+    return direction
 
-    return data
+def read_cpf_packed(cpf_dir,cpf_file,cache=True,headers_only=False):
+    """
+    Parse a single CPF ephemeris file and return the data in the compact form of pack_cpf.
+    It is used by worker processes, so that only compact arrays are transferred back to the main process.
+
+    Usage:
+        meta,arrays = read_cpf_packed(cpf_dir,cpf_file)
+
+    Inputs:
+        cpf_dir -> [str] Directory for storing CPF ephemeris files
+        cpf_file -> [str] name of the CPF ephemeris file
+
+    Parameters:
+        cache -> [bool, default = True] whether to use the binary cache of parsed CPF ephemeris files
+        headers_only -> [bool, default = False] whether to parse the header records only
+
+    Outputs:
+        meta -> [dictionary] header information
+        arrays -> [dictionary] numerical arrays of the CPF data
+    """
+    return pack_cpf(read_cpf(cpf_dir,cpf_file,cache,headers_only=headers_only))
+
+def parse_header(data,info):
+    """
+    Parse the fields of a H1 or H2 header record into the CPF data dictionary.
+
+    Usage:
+        parse_header(data,line.split())
+
+    Inputs:
+        data -> [dictionary] CPF data dictionary to be filled
+        info -> [list of str] whitespace-separated fields of a header record
+    """
+    if info[0] == 'H1':
+        data['Format'] = info[1]
+        data['Format Version'] = info[2]
+        data['Ephemeris Source'] = info[3]
+        data['Time of Ephemeris Production'] = header_time(info[4:8]+['0','0'])
+        data['Ephemeris Sequence Number'] = info[8]
+        data['Target Name'] = info[9]
+    elif info[0] == 'H2':
+        data['COSPAR ID'] = info[1]
+        data['SIC'] = info[2]
+        data['NORAD ID'] = info[3]
+        data['Start'] = header_time(info[4:10])
+        data['End'] = header_time(info[10:16])
+        data['Time Interval[sec]'] = info[16]
+
+        if info[17] == '1':
+            target_type = 'passive(retro-reflector) artificial satellite'
+        elif info[17] == '2':
+            target_type = 'passive(retro-reflector) lunar reflector'
+        elif info[17] == '3':
+            target_type = 'synchronous transponder'
+        elif info[17] == '4':
+            target_type = 'asynchronous transponder'
+        else:
+            raise Exception('Unknown target type')
+        data['Target Type'] = target_type
+
+        if info[19] == '0':
+            reference_frame = 'ITRF(default)'
+        elif info[19] == '1':
+            reference_frame = 'GCRF(True of Date)'
+        elif info[19] == '2':
+            reference_frame = 'GCRF(Mean of Date J2000.0)'
+        else:
+            raise Exception('Unknown reference frame type')
+        data['Reference Frame'] = reference_frame
+
+        if info[20] == '0':
+            rotational_angle = 'Not Applicable'
+        elif info[20] == '1':
+            rotational_angle = 'Lunar Euler angles: φ, θ, and ψ'
+        elif info[20] == '2':
+            rotational_angle = 'North pole Right Ascension and Declination, and angle to prime meridian (α0, δ0, and W)'
+        else:
+            raise Exception('Unknown rotational angle type')
+        data['Rotational Angle'] = rotational_angle
+
+        if info[21] == '0':
+            CM_correction = 'None applied. Prediction is for center of mass of target'
+        elif info[21] == '1':
+            CM_correction = 'Applied. Prediction is for retro-reflector array'
+        else:
+            raise Exception('Unknown center of mass correction type')
+        data['Center of Mass Correction'] = CM_correction
+
+def header_time(fields):
+    """
+    Convert the date and time fields(year, month, day, hour, minute, second) of a header record to an iso-formatted UTC string.
+    """
+    year,month,day,hour,minute,second = [int(field) for field in fields]
+    if not (1 <= month <= 12 and 1 <= day <= 31 and 0 <= hour < 24 and 0 <= minute < 60 and 0 <= second <= 60):
+        raise ValueError('Invalid date and time in header: {:s}'.format(' '.join(fields)))
+    return str(mjdsod2iso(date2mjd(year,month,day),hour*3600 + minute*60 + second)[0])
+
+def header_lines(cpf_data):
+    """
+    Extract the header records(H1, H2, ...) from the raw content of a CPF ephemeris file.
+
+    Usage:
+        lines = header_lines(cpf_data)
+
+    Inputs:
+        cpf_data -> [bytes] raw content of the CPF ephemeris file
+
+    Outputs:
+        lines -> [list of str] header records in order of appearance
+    """
+    buf = np.frombuffer(cpf_data,dtype=np.uint8)
+    starts = line_starts(buf)
+    starts = starts[starts < buf.size]
+    lines = []
+    for start in starts[buf[starts] == ord('H')]:
+        end = cpf_data.find(b'\n',start)
+        lines.append(cpf_data[start:end if end >= 0 else None].decode())
+    return lines
+
+def line_starts(buf):
+    """
+    Compute the byte offsets of the beginning of each line in a raw text buffer.
+    """
+    return np.concatenate(([0],np.flatnonzero(buf == ord('\n'))+1))
+
+def parse_records(cpf_data,record_type,n_fields):
+    """
+    Convert all records of a given type in a CPF ephemeris file to a float array in one pass.
+    Lines starting with the record type are located with byte masks. If the records are written in fixed columns, as CPF files usually are,
+    the digits are converted directly into numbers by a single matrix product; otherwise, the numpy text parser is used.
+
+    Usage:
+        records = parse_records(cpf_data,'10',8)
+
+    Inputs:
+        cpf_data -> [bytes] raw content of the CPF ephemeris file
+        record_type -> [str] record type, such as '10' for position records or '20' for velocity records
+        n_fields -> [int] number of fields in the record, including the record type
+
+    Outputs:
+        records -> [2d float array] records with shape of (number of records, n_fields)
+    """
+    buf = np.frombuffer(cpf_data,dtype=np.uint8)
+    starts = line_starts(buf)
+    ends = np.append(starts[1:]-1,buf.size)
+    code = record_type.encode()
+    k = len(code)
+
+    # A line belongs to the record type if it begins with the record code followed by a blank
+    padded = np.concatenate((buf,np.full(k+1,ord('\n'),dtype=np.uint8)))
+    selected = (padded[starts+k] == ord(' ')) | (padded[starts+k] == ord('\t'))
+    for i in range(k):
+        selected &= padded[starts+i] == code[i]
+    starts,ends = starts[selected],ends[selected]
+    n_records = len(starts)
+    if n_records == 0: return np.empty((0,n_fields))
+
+    records = parse_fixed_columns(buf,starts,ends-starts,n_fields)
+    if records is None:
+        text = b'\n'.join([cpf_data[start:end] for start,end in zip(starts,ends)]).decode()
+        values = np.fromstring(text,sep=' ')
+        if values.size != n_records*n_fields:
+            # Records with missing or extra fields are converted line by line
+            values = np.array([line.split()[:n_fields] for line in text.splitlines()],dtype=float)
+        records = values.reshape(n_records,n_fields)
+    return records
+
+def parse_fixed_columns(buf,starts,lengths,n_fields):
+    """
+    Convert records written in fixed columns with right-aligned numeric fields to a float array.
+    The digit characters are weighted by powers of ten column by column, so the conversion is exact.
+
+    Inputs:
+        buf -> [uint8 array] raw content of the CPF ephemeris file
+        starts -> [int array] byte offsets of the records
+        lengths -> [int array] lengths of the records in bytes
+        n_fields -> [int] number of fields in the record
+
+    Outputs:
+        records -> [2d float array or None] records with shape of (number of records, n_fields); None if the records are not in fixed columns.
+    """
+    n,width = len(starts),int(lengths[0])
+    if (lengths != width).any(): return None
+
+    steps = np.diff(starts)
+    if n > 1 and (steps != steps[0]).any():
+        chars = buf[starts[:,None] + np.arange(width)]
+    else:
+        step = int(steps[0]) if n > 1 else width
+        # Records separated only by line breaks are viewed as a contiguous block, with the line breaks as a blank column
+        if step == width+1 and starts[0] + n*step <= buf.size: width = step
+        chars = as_strided(buf[starts[0]:],shape=(n,width),strides=(step,1),writeable=False)
+
+    # Letters or other text make the records unsuitable for the column-wise conversion
+    if (chars > ord('9')).any(): return None
+    filled = chars > ord(' ')
+
+    # Fields are the runs of columns holding characters in any record
+    used = chars.max(axis=0) > ord(' ')
+    edges = np.diff(np.concatenate(([0],used.view(np.int8),[0])))
+    field_starts,field_ends = np.flatnonzero(edges == 1),np.flatnonzero(edges == -1)
+    if len(field_starts) != n_fields: return None
+
+    # Each field must be right-aligned and free of inner blanks in every record,
+    # that is, the only transitions from characters to blanks are at the ends of fields
+    tails = np.count_nonzero(filled[:,:-1] > filled[:,1:])
+    if tails != n*np.count_nonzero(field_ends < width) or not filled[:,field_ends-1].all(): return None
+
+    points = chars == ord('.')
+    point_columns = points[0].copy()
+    if np.count_nonzero(points) != n*np.count_nonzero(point_columns) or not points[:,point_columns].all(): return None
+
+    # The weights are split into the lower 7 digits and the higher 7 digits,
+    # so that all partial sums are integers below 2**24 and the float32 matrix product is exact.
+    weights = np.zeros((width,2*n_fields),dtype=np.float32)
+    scales = np.ones(n_fields)
+    for i,(start,end) in enumerate(zip(field_starts,field_ends)):
+        is_digit = ~point_columns[start:end]
+        if is_digit.sum() > 14: return None
+        exponents = np.cumsum(is_digit[::-1])[::-1] - 1
+        weights[start:end,i] = np.where(is_digit & (exponents < 7),10.0**(exponents % 7),0)
+        weights[start:end,n_fields+i] = np.where(is_digit & (exponents >= 7),10.0**(exponents % 7),0)
+        decimals = end - start - 1 - np.flatnonzero(point_columns[start:end])
+        if len(decimals) > 1: return None
+        if len(decimals): scales[i] = 10.0**decimals[0]
+
+    # Blanks, signs and decimal points are mapped to the digit 0
+    digits = chars - np.uint8(ord('0'))
+    digits *= digits < 10
+    mantissas = digits.astype(np.float32) @ weights
+    records = mantissas[:,n_fields:].astype(np.float64)
+    records *= 1e7
+    records += mantissas[:,:n_fields]
+    records /= scales
+
+    minus = chars == ord('-')
+    if minus.any():
+        sign_columns = np.flatnonzero(minus.any(axis=0))
+        fields = np.searchsorted(field_starts,sign_columns,side='right') - 1
+        for i in np.unique(fields):
+            records[minus[:,sign_columns[fields == i]].any(axis=1),i] *= -1
+    return records
@@ -0,0 +1,330 @@
+import numpy as np
+import erfa
+
+def mjd2date(mjd):
+    """
+    Convert integer MJD to calendar date.
+
+    Usage:
+        year,month,day = mjd2date(mjd)
+
+    Inputs:
+        mjd -> [int array] Modified Julian Date
+
+    Outputs:
+        year -> [int array] year
+        month -> [int array] month
+        day -> [int array] day of month
+    """
+    # Civil-from-days algorithm by H. Hinnant, with days counted from 1970-01-01(MJD 40587)
+    z = np.asarray(mjd,dtype=np.int64) - 40587 + 719468
+    era = np.floor_divide(z,146097)
+    doe = z - era*146097
+    yoe = (doe - doe//1460 + doe//36524 - doe//146096)//365
+    doy = doe - (365*yoe + yoe//4 - yoe//100)
+    mp = (5*doy + 2)//153
+    day = doy - (153*mp + 2)//5 + 1
+    month = np.where(mp < 10,mp + 3,mp - 9)
+    year = yoe + era*400 + (month <= 2)
+    return year,month,day
+
+def date2mjd(year,month,day):
+    """
+    Convert calendar date to integer MJD.
+
+    Usage:
+        mjd = date2mjd(year,month,day)
+
+    Inputs:
+        year -> [int array] year
+        month -> [int array] month
+        day -> [int array] day of month
+
+    Outputs:
+        mjd -> [int array] Modified Julian Date
+    """
+    # Days-from-civil algorithm by H. Hinnant, with days counted from 1970-01-01(MJD 40587)
+    year = np.asarray(year,dtype=np.int64) - (np.asarray(month) <= 2)
+    month = np.asarray(month,dtype=np.int64)
+    era = np.floor_divide(year,400)
+    yoe = year - era*400
+    doy = (153*np.where(month > 2,month - 3,month + 9) + 2)//5 + np.asarray(day,dtype=np.int64) - 1
+    doe = yoe*365 + yoe//4 - yoe//100 + doy
+    return era*146097 + doe - 719468 + 40587
+
+def iso2mjdsod(t):
+    """
+    Convert an iso-formatted UTC string, such as '2017-01-01 12:30:00' or '2017-01-01T12:30:00.500', to MJD and Second of Day.
+    Other formats supported by astropy are also accepted.
+
+    Usage:
+        mjd,sod = iso2mjdsod('2017-01-01 12:30:00')
+
+    Inputs:
+        t -> [str or object of class Astropy Time] iso-formatted UTC
+
+    Outputs:
+        mjd -> [int] MJD
+        sod -> [float] Second of Day
+    """
+    if not isinstance(t,str):
+        from astropy.time import Time
+        t = Time(t).utc
+        t.precision = 9
+        t = t.iso
+    try:
+        date,clock = t.strip().replace('T',' ').split(' ') if len(t.strip()) > 10 else (t.strip(),'0:0:0')
+        year,month,day = [int(x) for x in date.split('-')]
+        hour,minute,second = clock.split(':')
+        sod = int(hour)*3600 + int(minute)*60 + float(second)
+    except ValueError:
+        from astropy.time import Time
+        t = Time(t)
+        mjd = int(t.mjd)
+        return mjd,(t - Time(mjd,format='mjd')).sec
+    return int(date2mjd(year,month,day)),sod
+
+def iso2mjd(t):
+    """
+    Convert an iso-formatted UTC string, such as '2017-01-01 12:30:00', to MJD.
+
+    Usage:
+        mjd = iso2mjd('2017-01-01 12:30:00')
+
+    Inputs:
+        t -> [str] iso-formatted UTC
+
+    Outputs:
+        mjd -> [float] MJD
+    """
+    mjd,sod = iso2mjdsod(t)
+    return mjd + sod/86400
+
+def day_length(mjd):
+    """
+    Calculate the length of UTC days in seconds, which is 86401 for days ending with a positive leap second.
+
+    Usage:
+        seconds = day_length(mjd)
+
+    Inputs:
+        mjd -> [int array] Modified Julian Date
+
+    Outputs:
+        seconds -> [int array] length of day in seconds
+    """
+    mjd = np.asarray(mjd,dtype=np.int64)
+    year,month,day = mjd2date(mjd)
+    year_next,month_next,day_next = mjd2date(mjd+1)
+    dat = erfa.dat(year,month,day,0.0)
+    dat_next = erfa.dat(year_next,month_next,day_next,0.0)
+    return 86400 + np.rint(dat_next - dat).astype(np.int64)
+
+def normalize_mjdsod(mjd,sod):
+    """
+    Carry Second of Day that exceeds the length of the day over to the following days, taking the leap seconds into account.
+
+    Usage:
+        mjd,sod = normalize_mjdsod(mjd,sod)
+
+    Inputs:
+        mjd -> [int array] MJD
+        sod -> [float array] Second of Day, which may exceed the length of the day
+
+    Outputs:
+        mjd -> [int array] MJD
+        sod -> [float array] Second of Day within the day
+    """
+    mjd,sod = np.broadcast_arrays(np.array(mjd,dtype=np.int64,ndmin=1),np.array(sod,dtype=float,ndmin=1))
+    mjd,sod = mjd.copy(),sod.copy()
+    while True:
+        over = sod >= 86400
+        if not over.any(): break
+        # Day lengths are only looked up for the epochs beyond 86400 seconds
+        length = day_length(mjd[over])
+        carry = sod[over] >= length
+        if not carry.any(): break
+        sod[over] -= np.where(carry,length,0)
+        mjd[over] += carry
+    return mjd,sod
+
+def mjdsod2iso(mjd,sod,sep=' '):
+    """
+    Format UTC epochs given by MJD and Second of Day as iso strings with millisecond precision, such as '2017-01-01 00:00:00.000'.
+    The formatting is done with integer arithmetic and agrees with the 'iso' format of astropy for epochs since 1972, including the leap second(23:59:60).
+
+    Usage:
+        ts_iso = mjdsod2iso(mjd,sod)
+        ts_isot = mjdsod2iso(mjd,sod,sep='T')
+
+    Inputs:
+        mjd -> [int array] MJD
+        sod -> [float array] Second of Day
+
+    Parameters:
+        sep -> [str, default = ' '] separator between the date and the time; 'T' gives the 'isot' format of astropy
+
+    Outputs:
+        ts_iso -> [str array] iso-formatted UTC
+    """
+    mjd = np.array(mjd,dtype=np.int64,ndmin=1)
+    ms = np.floor(np.asarray(sod,dtype=float)*1000 + 0.5).astype(np.int64)
+
+    # Carry the rounded milliseconds over to the next day
+    overflow = ms >= 86400000
+    if overflow.any():
+        day_ms = 1000*day_length(mjd[overflow])
+        carry = ms[overflow] >= day_ms
+        ms[overflow] -= np.where(carry,day_ms,0)
+        mjd[overflow] += carry
+
+    # Dates are formatted once for each day spanned by the epochs
+    mjd_min = mjd.min()
+    year,month,day = mjd2date(np.arange(mjd_min,mjd.max()+1))
+    dates = np.empty((len(year),10),dtype=np.uint8)
+    for value,start,width in [(year,0,4),(month,5,2),(day,8,2)]:
+        for i in range(width):
+            dates[:,start+width-1-i] = ord('0') + value//10**i%10
+    dates[:,[4,7]] = ord('-')
+
+    hour = np.minimum(ms//3600000,23)
+    ms = ms - hour*3600000
+    minute = np.minimum(ms//60000,59)
+    ms = ms - minute*60000
+    clock = hour*10000000 + minute*100000 + ms
+
+    # Assemble the strings in a byte array of 'YYYY-MM-DD hh:mm:ss.sss'
+    chars = np.empty((len(mjd),23),dtype=np.uint8)
+    chars[:,:10] = dates[mjd - mjd_min]
+    chars[:,10] = ord(sep)
+    for column in [22,21,20,18,17,15,14,12,11]:
+        clock,digit = np.divmod(clock,10)
+        chars[:,column] = digit + ord('0')
+    chars[:,[13,16]] = ord(':')
+    chars[:,19] = ord('.')
+
+    return chars.view('S23').ravel().astype('U23')
+
+def time2mjdsod(ts):
+    """
+    Convert epochs given as an Astropy Time object to MJD and Second of Day in UTC.
+    The conversion is numerical from the two-part Julian dates by erfa, which handles the days with a leap second,
+    so no iso-formatted strings are generated and parsed in between.
+
+    Usage:
+        mjd,sod = time2mjdsod(ts)
+
+    Inputs:
+        ts -> [object of class Astropy Time] epochs in any time scale
+
+    Outputs:
+        mjd -> [int array] MJD
+        sod -> [float array] Second of Day with nanosecond resolution, which runs up to 86401 on a day with a leap second
+    """
+    ts = ts.utc
+    year,month,day,ihmsf = erfa.d2dtf(b'UTC',9,ts.jd1,ts.jd2)
+    mjd = date2mjd(year,month,day)
+    sod = (ihmsf['h']*3600 + ihmsf['m']*60 + ihmsf['s']) + ihmsf['f']*1e-9
+    return mjd,sod
+
+def mjdsod2ns(mjd,sod,leap_second=0,mjd_ref=0):
+    """
+    Convert epochs given by MJD, Second of Day and leap second flag to integer nanoseconds from the beginning of a reference MJD, with the leap second flag folded in.
+    It is the integer counterpart of the quasi MJD defined in interp_ephem, so that one second of the leap second day is one second on the time axis.
+
+    Usage:
+        ts_ns = mjdsod2ns(mjd,sod,leap_second,mjd_ref)
+
+    Inputs:
+        mjd -> [int array] MJD
+        sod -> [float array] Second of Day
+        
+    Parameters:
+        leap_second -> [int array, default = 0] leap second flag
+        mjd_ref -> [int, default = 0] reference MJD
+
+    Outputs:
+        ts_ns -> [int64 array] nanoseconds from the beginning of the reference MJD
+    """
+    mjd = np.asarray(mjd,dtype=np.int64)
+    ns = np.rint(np.asarray(sod,dtype=float)*1e9).astype(np.int64)
+    return (mjd - mjd_ref)*86400000000000 + ns + np.asarray(leap_second,dtype=np.int64)*1000000000
+
+# Table of TAI-UTC, which is loaded once on the first lookup
+LEAP_SECOND_TABLE = None
+
+def load_leap_seconds(leapsecond_file=None):
+    """
+    Load the table of TAI-UTC from the Leap Second file of IERS, as downloaded by download_iers, and keep it for the subsequent lookups.
+    If the file is not available, the built-in table of erfa is used instead.
+
+    Usage:
+        mjd_table,tai_utc_table = load_leap_seconds()
+
+    Parameters:
+        leapsecond_file -> [str, default = None] path of the Leap Second file. If None, 'Leap_Second.dat' in ~/src/iers/ is used.
+
+    Outputs:
+        mjd_table -> [int array] MJD from which the values of TAI-UTC apply
+        tai_utc_table -> [int array] TAI-UTC in seconds
+    """
+    global LEAP_SECOND_TABLE
+    from os import path
+    from pathlib import Path
+
+    if leapsecond_file is None:
+        leapsecond_file = str(Path.home()) + '/src/iers/Leap_Second.dat'
+    if path.exists(leapsecond_file):
+        mjd_table,tai_utc_table = np.loadtxt(leapsecond_file,comments='#',usecols=(0,4),ndmin=2).T
+    else:
+        table = erfa.leap_seconds.get()
+        # Only the whole leap seconds since 1972 are kept
+        table = table[table['year'] >= 1972]
+        mjd_table,tai_utc_table = date2mjd(table['year'],table['month'],1),table['tai_utc']
+    LEAP_SECOND_TABLE = (np.asarray(mjd_table,dtype=np.int64),np.rint(tai_utc_table).astype(np.int64))
+    return LEAP_SECOND_TABLE
+
+def leap_seconds(mjd,mjd_ref):
+    """
+    Count the leap seconds inserted between the beginning of a reference MJD and the beginning of the given MJD by a lookup in the table of TAI-UTC.
+    The counts serve as the leap second flag of mjdsod2ns, which places epochs across any number of leap seconds on one continuous time axis.
+
+    Usage:
+        leap_second = leap_seconds(mjd,mjd_ref)
+
+    Inputs:
+        mjd -> [int array] MJD
+        mjd_ref -> [int] reference MJD
+
+    Outputs:
+        leap_second -> [int array] number of leap seconds, which is negative for MJD before the reference MJD
+    """
+    mjd_table,tai_utc_table = LEAP_SECOND_TABLE if LEAP_SECOND_TABLE is not None else load_leap_seconds()
+    index = np.searchsorted(mjd_table,np.asarray(mjd,dtype=np.int64),side='right') - 1
+    index_ref = np.searchsorted(mjd_table,mjd_ref,side='right') - 1
+    # Epochs before the table take its first value
+    return tai_utc_table[np.maximum(index,0)] - tai_utc_table[max(index_ref,0)]
+
+def leap_second_step(mjd,mjd_ref):
+    """
+    Locate the leap second within the span of the MJD of CPF position records by a lookup in the table of TAI-UTC, as with leap_seconds.
+    A span of a few days contains at most one leap second, so the leap seconds from the reference MJD reduce to a single step.
+
+    Usage:
+        leap_mjd,leap_second = leap_second_step(mjd,mjd_ref)
+
+    Inputs:
+        mjd -> [int array] MJD of the position records
+        mjd_ref -> [int] reference MJD
+
+    Outputs:
+        leap_mjd -> [int or None] MJD from which the leap second applies; None if no leap second is involved
+        leap_second -> [int] number of leap seconds from leap_mjd on
+    """
+    mjd = np.asarray(mjd,dtype=np.int64)
+    leap_second = leap_seconds(mjd,mjd_ref)
+    changes = np.flatnonzero(np.diff(leap_second))
+    if len(changes):
+        return int(mjd[changes[0]+1]),int(leap_second[changes[0]+1])
+    # A count that is constant over the span applies from its beginning
+    return (None,0) if not leap_second[0] else (int(mjd[0]),int(leap_second[0]))
@@ -0,0 +1,188 @@
+import json
+
+import numpy as np
+
+from ..cpf.cpf_interpolate import interp_ephem
+from ..cpf.cpf_time import iso2mjdsod, leap_seconds, leap_second_step
+
+
+class CPFChebyshev(object):
+    """
+    class CPFChebyshev
+
+    CPF ephemeris compiled into piecewise Chebyshev polynomials over segments of equal length, similar to the type 2 segments of SPK files.
+    Evaluating the position at an epoch takes a segment lookup by arithmetic and a Clenshaw recurrence, which is much cheaper than
+    building the Lagrange interpolants of the CPF ephemeris.
+
+    Attributes:
+        header -> [dictionary] header information of the CPF ephemeris
+        mjd_ref -> [int] reference MJD; epochs are counted in quasi seconds(SoD + Leap Second) from its beginning
+        t_start -> [float] beginning of the first segment in quasi seconds from the reference MJD
+        t_end -> [float] end of the compiled span in quasi seconds from the reference MJD
+        segment_length -> [float] length of the segments in seconds
+        coefficients -> [3d float array] Chebyshev coefficients with shape of (number of segments, degree + 1, 3)
+        leap_mjd -> [int or None] MJD from which the leap second applies; None if no leap second is involved
+        leap_second -> [int] number of leap seconds from leap_mjd on
+        fit_error -> [float] maximum deviation of the compiled polynomials from the records of the CPF ephemeris in meters
+    """
+
+    def __init__(self, header, mjd_ref, t_start, t_end, segment_length, coefficients, leap_mjd=None, leap_second=0, fit_error=np.nan):
+
+        self.header = header
+        self.mjd_ref = int(mjd_ref)
+        self.t_start = float(t_start)
+        self.t_end = float(t_end)
+        self.segment_length = float(segment_length)
+        self.coefficients = np.ascontiguousarray(coefficients, dtype=np.float64)
+        self.leap_mjd = None if leap_mjd is None else int(leap_mjd)
+        self.leap_second = int(leap_second)
+        self.fit_error = float(fit_error)
+
+    def __repr__(self):
+
+        n_segments, n_coefficients, _ = self.coefficients.shape
+        return 'instance of class CPFChebyshev for {:s} with {:d} segments of degree {:d}'.format(
+            self.header.get('Target Name', 'unknown target'), n_segments, n_coefficients - 1)
+
+    def from_ephemeris(ephemeris, segment_length=None, degree=13):
+        """
+        Compile a CPF ephemeris into piecewise Chebyshev polynomials.
+
+        Usage:
+            cheb = CPFChebyshev.from_ephemeris(ephemeris)
+            cheb = CPFChebyshev.from_ephemeris(ephemeris,segment_length=600,degree=15)
+
+        Inputs:
+            ephemeris -> [object] instance of class CPFEphemeris as returned by read_cpf
+
+        Parameters:
+            segment_length -> [float, default = None] maximum length of the segments in seconds. If None, 8 times the interval of the CPF records is used.
+            degree -> [int, default = 13] degree of the Chebyshev polynomials
+
+        Outputs:
+            cheb -> [object] instance of class CPFChebyshev
+
+        Note: The polynomials are fitted to the 10-point Lagrange interpolant of the CPF ephemeris over its interpolation range,
+        that is, from the 5th record to the 5th last record, at the Chebyshev points of each segment.
+        """
+        mjd, sod = ephemeris.mjd, ephemeris.sod
+        if len(mjd) < 10:
+            raise ValueError('At least 10 position records are required for the compilation')
+
+        mjd_ref = int(mjd[0])
+        # The leap seconds are taken from the table of TAI-UTC, the same as interp_epochs
+        ts_cpf = (mjd - mjd_ref)*86400.0 + sod + leap_seconds(mjd, mjd_ref)
+        t_start, t_end = ts_cpf[4], ts_cpf[-5]
+        if segment_length is None: segment_length = 8*(ts_cpf[-1] - ts_cpf[0])/(len(ts_cpf) - 1)
+        # The segment length is shortened slightly, so that the segments cover the interpolation range exactly
+        n_segments = max(1, int(np.ceil((t_end - t_start)/segment_length - 1e-9)))
+        segment_length = (t_end - t_start)/n_segments
+
+        # Interpolation at the Chebyshev points of the first kind, with coefficients obtained by a discrete cosine transform
+        n_points = degree + 1
+        theta = np.pi*(np.arange(n_points) + 0.5)/n_points
+        transform = 2/n_points*np.cos(np.outer(np.arange(n_points), theta))
+        transform[0] /= 2
+
+        mid = t_start + (np.arange(n_segments) + 0.5)*segment_length
+        ts = (mid[:, None] + segment_length/2*np.cos(theta)).ravel()
+        samples = interp_ephem(ts, ts_cpf, ephemeris.positions).reshape(n_segments, n_points, 3)
+        coefficients = np.einsum('kj,sjc->skc', transform, samples)
+
+        leap_mjd, leap_second = leap_second_step(mjd, mjd_ref)
+        cheb = CPFChebyshev(ephemeris.header, mjd_ref, t_start, t_end, segment_length, coefficients, leap_mjd, leap_second)
+
+        # Fit error against the records within the compiled span
+        inside = slice(4, len(ts_cpf) - 4)
+        cheb.fit_error = np.abs(cheb.evaluate_quasi(ts_cpf[inside]) - ephemeris.positions[inside]).max()
+
+        return cheb
+
+    def quasi_seconds(self, ts_mjd, ts_sod):
+        """
+        Convert epochs given by MJD and Second of Day to quasi seconds from the reference MJD, taking the leap second into account.
+        """
+        ts_mjd = np.asarray(ts_mjd)
+        ts = (ts_mjd - self.mjd_ref)*86400.0 + ts_sod
+        if self.leap_mjd is not None:
+            ts = ts + np.where(ts_mjd >= self.leap_mjd, self.leap_second, 0)
+        return ts
+
+    def evaluate_quasi(self, ts):
+        """
+        Evaluate the positions at epochs given in quasi seconds from the reference MJD.
+
+        Usage:
+            positions = cheb.evaluate_quasi(ts)
+
+        Inputs:
+            ts -> [float array] epochs in quasi seconds from the reference MJD
+
+        Outputs:
+            positions -> [2d float array] target positions in cartesian coordinates in meters
+        """
+        ts = np.atleast_1d(np.asarray(ts, dtype=float))
+        tolerance = 1e-6
+        if (ts < self.t_start - tolerance).any() or (ts > self.t_end + tolerance).any():
+            raise ValueError('Epochs are outside the compiled span of the CPF ephemeris')
+
+        n_segments = len(self.coefficients)
+        segments = np.clip(((ts - self.t_start)//self.segment_length).astype(int), 0, n_segments - 1)
+        x = 2*(ts - self.t_start - segments*self.segment_length)/self.segment_length - 1
+
+        # Clenshaw recurrence over the coefficients of the segments
+        coefficients = self.coefficients[segments]
+        x2 = 2*x[:, None]
+        b1 = np.zeros((len(ts), 3))
+        b2 = np.zeros((len(ts), 3))
+        for k in range(coefficients.shape[1] - 1, 0, -1):
+            b1, b2 = x2*b1 - b2 + coefficients[:, k], b1
+        return x[:, None]*b1 - b2 + coefficients[:, 0]
+
+    def evaluate(self, ts_mjd, ts_sod):
+        """
+        Evaluate the positions at epochs given by MJD and Second of Day in UTC.
+
+        Usage:
+            positions = cheb.evaluate(ts_mjd,ts_sod)
+
+        Inputs:
+            ts_mjd -> [int array] MJD
+            ts_sod -> [float array] Second of Day
+
+        Outputs:
+            positions -> [2d float array] target positions in cartesian coordinates in meters, in the reference frame of the CPF ephemeris
+        """
+        return self.evaluate_quasi(self.quasi_seconds(ts_mjd, ts_sod))
+
+    def evaluate_iso(self, ts_utc):
+        """
+        Evaluate the positions at epochs given by iso-formatted UTC, such as '2017-01-01 12:00:00'.
+        """
+        ts_mjd, ts_sod = np.array([iso2mjdsod(t) for t in np.atleast_1d(ts_utc)]).T
+        return self.evaluate(ts_mjd.astype(int), ts_sod)
+
+    def save(self, path):
+        """
+        Save the compiled polynomials to a binary file in npz format.
+
+        Usage:
+            cheb.save('lageos1.npz')
+        """
+        meta = {'header': self.header, 'mjd_ref': self.mjd_ref, 't_start': self.t_start, 't_end': self.t_end,
+                'segment_length': self.segment_length, 'leap_mjd': self.leap_mjd, 'leap_second': self.leap_second, 'fit_error': self.fit_error}
+        with open(path, 'wb') as f:
+            np.savez(f, meta=json.dumps(meta), coefficients=self.coefficients)
+
+    def load(path):
+        """
+        Load the compiled polynomials from a binary file written by save.
+
+        Usage:
+            cheb = CPFChebyshev.load('lageos1.npz')
+        """
+        with np.load(path) as f:
+            meta = json.loads(str(f['meta']))
+            coefficients = f['coefficients']
+        return CPFChebyshev(meta['header'], meta['mjd_ref'], meta['t_start'], meta['t_end'], meta['segment_length'],
+                            coefficients, meta['leap_mjd'], meta['leap_second'], meta['fit_error'])
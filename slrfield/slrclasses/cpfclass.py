@@ -1,7 +1,12 @@
 from os import system, path, makedirs, walk
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-from ..cpf.cpf_interpolate import cpf_interp_azalt, cpf_interp_xyz, next_pass_horizon, cpf_interp_xyz_times
-from ..cpf.cpf_read import read_cpf
+from ..cpf.cpf_interpolate import cpf_interp_azalt, cpf_interp_xyz, next_pass_horizon, cpf_interp_xyz_times, cpf_interp_xyz_stack, cpf_interp_azalt_network
+from ..cpf.cpf_read import read_cpf, read_cpf_packed
+from ..cpf.cpf_cache import unpack_cpf
+from ..cpf.cpf_index import query_index
+from .cpftracker import CPFTracker
 
 import numpy as np
 
@@ -39,7 +44,7 @@ class CPF(object):
 
         return 'instance of class CPF'
 
-    def from_files(cpf_dir, cpf_files=None):
+    def from_files(cpf_dir, cpf_files=None, cache=True, workers=None, headers_only=False):
         """
         Parse a single CPF ephemeris file of a set of CPF ephemeris files and read the data.
 
@@ -47,9 +52,15 @@ class CPF(object):
             cpf_dir -> [str] Directory for storing CPF ephemeris files
 
         Parameters:    
-            cpf_files -> [str,list of str,default=None] name of CPF ephemeris file, such as 'ajisai_cpf_170829_7411.hts'; 
+            cpf_files -> [str,list of str,dict,default=None] name of CPF ephemeris file, such as 'ajisai_cpf_170829_7411.hts'; 
             or list of filenames, such as ['CPF/EDC/2016-12-31/starlette_cpf_161231_8661.sgf','CPF/CDDIS/2020-04-15/lageos1_cpf_200415_6061.jax'];
+            or a query to the index of the local CPF archive in cpf_dir, such as {'targets':['lageos1','ajisai'],'epoch':'2017-01-02 12:00:00'}, see query_index for the available keys;
             if None, all CPF ephemeris files in CPF directory will be loaded.
+            cache -> [bool, default = True] whether to use the binary cache of parsed CPF ephemeris files in '~/src/cpf_cache/'.
+            workers -> [int, default = None] number of worker processes for parsing the CPF ephemeris files in parallel.
+            If None or 1, the files are parsed sequentially. The order of the parsed data follows the order of the files in any case.
+            headers_only -> [bool, default = False] If True, only the header records(H1, H2, ...) are parsed, which is suitable for quickly scanning CPF archives,
+            such as picking the latest prediction for each target. Predictions are not available in this case.
 
         Outputs:
             cpf_data  -> [object] instance of class CPF
@@ -62,14 +73,22 @@ class CPF(object):
                 pass
         elif type(cpf_files) is str:
             cpf_files = [cpf_files]
+        elif type(cpf_files) is dict:
+            cpf_files = query_index(cpf_dir, **cpf_files)
 
         print(cpf_files)
-        for cpf_file in cpf_files:
-            data.append(read_cpf(cpf_dir, cpf_file))
+        if workers is None or workers == 1 or len(cpf_files) < 2:
+            for cpf_file in cpf_files:
+                data.append(read_cpf(cpf_dir, cpf_file, cache, headers_only=headers_only))
+        else:
+            chunksize = max(1, len(cpf_files)//(4*workers))
+            with ProcessPoolExecutor(workers) as executor:
+                for meta, arrays in executor.map(read_cpf_packed, repeat(cpf_dir), cpf_files, repeat(cache), repeat(headers_only), chunksize=chunksize):
+                    data.append(unpack_cpf(meta, arrays))
 
         return CPF(data, cpf_dir)
 
-    def pred_xyz_itrs_at_time(self, times, keep=True):
+    def pred_xyz_itrs_at_time(self, times, keep=True, derivatives=0, method='lagrange'):
         data = self.info
 
         results = []
@@ -77,28 +96,123 @@ class CPF(object):
             target = cpf_data['Target Name']
             # predfile = open(dir_pred_to+target+'.txt', 'w')
 
-            ts_utc_cpf = cpf_data['ts_utc']
-            ts_mjd_cpf = cpf_data['MJD']
-            ts_sod_cpf = cpf_data['SoD']
-            positions_cpf = cpf_data['positions[m]']
-            leap_second_cpf = cpf_data['Leap_Second']
+            ts, ts_mjd, ts_sod, *xyz = cpf_interp_xyz_times(cpf_data, times, derivatives=derivatives, method=method)
 
-            ts, ts_mjd, ts_sod, x, y, z = cpf_interp_xyz_times(
-                ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, times)
-
-            positions = np.array([x, y, z]).T
-            print(positions.shape)
-            results.append([ts, positions])
+            # positions, followed by velocities and accelerations if requested
+            states = [np.array(xyz[i:i+3]).T for i in range(0, len(xyz), 3)]
+            results.append([ts, *states])
 
         return results
 
-    def pred_xyz(self, t_start, t_end, t_increment, keep=True):
+    def tracker(self, target, station, coord_type='geodetic'):
+        """
+        Create a low-latency evaluator of a loaded CPF ephemeris bound to a station, for closed-loop tracking at single epochs.
+
+        Usage:
+            tracker = cpf_data.tracker('lageos1',station)
+            az,alt,r = tracker.azalt(57754,3600.5)
+
+        Inputs:
+            target -> [str or int] name of the target, or index of the CPF ephemeris as loaded. If several CPF ephemerides of the target are loaded, the first is used.
+            station -> [numercial array or list with 3 elements] coordinates of station. It can either be geocentric(x, y, z) coordinates or geodetic(lon, lat, height) coordinates.
+            Unit for (x, y, z) are meter, and for (lon, lat, height) are degree and meter.
+
+        Parameters:
+            coord_type -> [str, default = 'geodetic'] coordinates type for coordinates of station; it can either be 'geocentric' or 'geodetic'.
+
+        Outputs:
+            tracker -> [object] instance of class CPFTracker
+        """
+        if type(target) is str:
+            if target not in self.target_name:
+                raise Exception('Target {:s} is not loaded'.format(target))
+            target = self.target_name.index(target)
+        return CPFTracker(self.info[target], station, coord_type)
+
+    def pred_xyz_stack(self, times, targets=None, frame='itrs', engine='cached'):
+        """
+        Predict the cartesian coordinates of all loaded targets, or a subset of them, at a common set of epochs in a single vectorized pass,
+        such as full-constellation snapshots for network-wide visibility maps.
+
+        Usage:
+            names,positions = cpf_data.pred_xyz_stack(times)
+            names,positions = cpf_data.pred_xyz_stack(times,targets=['lageos1','lageos2'],frame='gcrf')
+
+        Inputs:
+            times -> [str array] iso-formatted UTC for prediction, such as ['2017-01-02 17:06:40','2017-01-02 17:06:45']
+
+        Parameters:
+            targets -> [list of str or int, default = None] names of the targets, or indices of the CPF ephemerides as loaded. If None, all loaded CPF ephemerides are used.
+            frame -> [str, default = 'itrs'] reference frame of the outputs, 'itrs' or 'gcrf'
+            engine -> [str or object, default = 'cached'] source of the rotation from ITRF to GCRF, 'cached', an instance of class EarthOrientation or 'astropy'; see pred_xyz
+
+        Outputs:
+            names -> [list of str] target names along the first axis of positions
+            positions -> [3d float array] target positions in cartesian coordinates in meters with shape of (number of targets, number of epochs, 3).
+            Epochs outside the interpolation range of a CPF ephemeris are filled with NaN.
+        """
+        selected = self.select_targets(targets)
+        positions = cpf_interp_xyz_stack([self.info[i] for i in selected], times, frame, engine)
+
+        return [self.target_name[i] for i in selected], positions
+
+    def pred_azalt_network(self, stations, times, targets=None, coord_type='geodetic', polar_motion=False):
+        """
+        Predict the azimuth, altitude and distance of all loaded targets, or a subset of them, from a network of stations at a common set of epochs in a single broadcast computation.
+        The CPF ephemerides are interpolated once and shared by all stations.
+
+        Usage:
+            names,az,alt,r = cpf_data.pred_azalt_network(stations,times)
+            names,az,alt,r = cpf_data.pred_azalt_network(stations,times,targets=['lageos1','lageos2'],coord_type='geocentric')
+
+        Inputs:
+            stations -> [2d float array] coordinates of stations with shape of (number of stations, 3). They can either be geocentric(x, y, z) coordinates or geodetic(lon, lat, height) coordinates.
+            Unit for (x, y, z) are meter, and for (lon, lat, height) are degree and meter.
+            times -> [str array] iso-formatted UTC for prediction, such as ['2017-01-02 17:06:40','2017-01-02 17:06:45']
+
+        Parameters:
+            targets -> [list of str or int, default = None] names of the targets, or indices of the CPF ephemerides as loaded. If None, all loaded CPF ephemerides are used.
+            coord_type -> [str, default = 'geodetic'] coordinates type for coordinates of stations; it can either be 'geocentric' or 'geodetic'.
+            polar_motion -> [bool, default = False] whether to refer the azimuth and altitude to the Celestial Intermediate Pole
+
+        Outputs:
+            names -> [list of str] target names along the second axis of the outputs
+            az -> [3d float array] Azimuth in degrees with shape of (number of stations, number of targets, number of epochs)
+            alt -> [3d float array] Altitude in degrees with the same shape
+            r -> [3d float array] Distance in meters with the same shape
+            Epochs outside the interpolation range of a CPF ephemeris are filled with NaN.
+        """
+        selected = self.select_targets(targets)
+        az, alt, r = cpf_interp_azalt_network([self.info[i] for i in selected], stations, times, coord_type, polar_motion)
+
+        return [self.target_name[i] for i in selected], az, alt, r
+
+    def select_targets(self, targets=None):
+        """
+        Resolve target names or indices to the indices of the loaded CPF ephemerides; all CPF ephemerides of a target name are selected.
+        """
+        if targets is None:
+            return list(range(len(self.info)))
+
+        selected = []
+        for target in targets:
+            if type(target) is str:
+                matched = [i for i, name in enumerate(self.target_name) if name == target]
+                if not matched:
+                    raise Exception('Target {:s} is not loaded'.format(target))
+                selected.extend(matched)
+            else:
+                selected.append(target)
+        return selected
+
+    def pred_xyz(self, t_start, t_end, t_increment, keep=True, derivatives=0, method='lagrange', engine='cached'):
         """
         Predict the cartesian coordinates of the target in GCRF.
 
         Usage:
             cpf_data.pred_xyz(t_start,t_end,t_increment)
             cpf_data.pred_xyz(t_start,t_end,t_increment,keep=False)
+            cpf_data.pred_xyz(t_start,t_end,t_increment,derivatives=1)
 
         Inputs:
             t_start -> [str] starting date and time for prediction, such as '2016-12-31 20:06:40'
@@ -107,11 +221,17 @@ class CPF(object):
 
         Parameters:
             keep -> [bool, default = True] whether or not keep the prediction files in the storing directory.
+            derivatives -> [int, default = 0] If 1, the velocities are also written to the prediction files; if 2, the velocities and accelerations are written.
+            method -> [str, default = 'lagrange'] interpolation method; 'lagrange' for the 10-point Lagrange interpolation of the position records,
+            or 'hermite' for the 4-point Hermite interpolation of the position and velocity records(type 20).
+            engine -> [str or object, default = 'cached'] source of the rotation from ITRF to GCRF; 'cached' for the interpolated Earth orientation,
+            an instance of class EarthOrientation, or 'astropy' for the full transformation of astropy at every epoch
 
         Outputs:
             target_name.txt -> [str] output prediction file with filename of target_name in directory pred
             Note:
             (1) The 10-point(degree 9) Lagrange polynomial interpolation method is used to interpolate the cpf ephemeris.
+            The velocities and accelerations are the derivatives of the same interpolating polynomial.
             (2) The influence of leap second is considered in the prediction generation.
         """
 
@@ -123,28 +243,26 @@ class CPF(object):
 
         data = self.info
 
+        titles = ['x[m]', 'y[m]', 'z[m]', 'vx[m/s]', 'vy[m/s]', 'vz[m/s]', 'ax[m/s^2]', 'ay[m/s^2]', 'az[m/s^2]'][:3*(derivatives+1)]
+        formats = ['{:13.3f}']*3 + ['{:13.6f}']*3 + ['{:13.9f}']*3
+
         for cpf_data in data:
             target = cpf_data['Target Name']
             predfile = open(dir_pred_to+target+'.txt', 'w')
 
-            ts_utc_cpf = cpf_data['ts_utc']
-            ts_mjd_cpf = cpf_data['MJD']
-            ts_sod_cpf = cpf_data['SoD']
-            positions_cpf = cpf_data['positions[m]']
-            leap_second_cpf = cpf_data['Leap_Second']
-
-            ts, ts_mjd, ts_sod, x, y, z = cpf_interp_xyz(
-                ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, t_start, t_end, t_increment)
+            ts, ts_mjd, ts_sod, *xyz = cpf_interp_xyz(
+                cpf_data, t_start, t_end, t_increment, derivatives=derivatives, method=method, engine=engine)
 
             n = len(ts)
-            predfile.write('{:^24s}  {:^5s}  {:^11s}  {:^13s}  {:^13s}  {:^13s}\n'.format(
-                'UTC', 'MJD', 'SOD', 'x[m]', 'y[m]', 'z[m]'))
+            predfile.write(('{:^24s}  {:^5s}  {:^11s}' + '  {:^13s}'*len(titles) + '\n').format(
+                'UTC', 'MJD', 'SOD', *titles))
+            line = '{:24s}  {:5d}  {:11.5f}  ' + '  '.join(formats[:len(titles)]) + '\n'
             for i in range(n):
-                predfile.write('{:24s}  {:5d}  {:11.5f}  {:13.3f}  {:13.3f}  {:13.3f}\n'.format(
-                    ts[i]+'Z', ts_mjd[i], ts_sod[i], x[i], y[i], z[i]))
+                predfile.write(line.format(
+                    ts[i]+'Z', ts_mjd[i], ts_sod[i], *[component[i] for component in xyz]))
             predfile.close()
 
-    def pred_azalt(self, station, t_start, t_end, t_increment, coord_type='geodetic', cutoff=10, mode='apparent', keep=True):
+    def pred_azalt(self, station, t_start, t_end, t_increment, coord_type='geodetic', cutoff=10, mode='apparent', keep=True, method='lagrange', engine='native', polar_motion=False, light_time_tolerance=None):
         """
         Predict the azimuth, altitude, distance of the target, and the time of flight for laser pulse etc. given the coordinates of the station.
 
@@ -165,6 +283,13 @@ class CPF(object):
             cutoff -> [float,default = 10] altitude cut-off angle
             mode -> [str, default = 'apparent']  whether to consider the light time; if 'geometric', instantaneous position vector from station to target is computed; 
             if 'apparent', position vector containing light time from station to target is computed.
+            method -> [str, default = 'lagrange'] interpolation method; 'lagrange' for the 10-point Lagrange interpolation of the position records,
+            or 'hermite' for the 4-point Hermite interpolation of the position and velocity records(type 20).
+            engine -> [str, default = 'native'] transformation to the topocentric reference frame; 'native' for the direct rotation of the station-to-target vectors in ITRF,
+            or 'astropy' for the transformation through the celestial frames of astropy as a reference.
+            polar_motion -> [bool, default = False] whether the native engine refers the azimuth and altitude to the Celestial Intermediate Pole
+            light_time_tolerance -> [float, default = None] for the apparent mode, tolerance in seconds for the iterated solution of the light time, such as 1e-12.
+            If None, the light time is taken in a single step from the instantaneous range.
 
         Outputs:
             target_name.txt -> [str] output prediction file with filename of target_name in directory pred
@@ -185,15 +310,9 @@ class CPF(object):
 
         for cpf_data in data:
             target = cpf_data['Target Name']
-            ts_utc_cpf = cpf_data['ts_utc']
-            ts_mjd_cpf = cpf_data['MJD']
-            ts_sod_cpf = cpf_data['SoD']
-            positions_cpf = cpf_data['positions[m]']
-            leap_second_cpf = cpf_data['Leap_Second']
-
-            t_step = (ts_sod_cpf[1] - ts_sod_cpf[0])//6
-            passes = next_pass_horizon(ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf,
-                                       positions_cpf, t_start, t_end, t_step, station, coord_type, cutoff)
+            t_step = (cpf_data.sod[1] - cpf_data.sod[0])//6
+            passes = next_pass_horizon(
+                cpf_data, t_start, t_end, t_step, station, coord_type, cutoff, method=method, engine=engine, polar_motion=polar_motion)
 
             j = 1
             for t_start_pass, t_end_pass in passes:
@@ -201,7 +320,7 @@ class CPF(object):
                     dir_pred_to, target, j), 'w')
                 if mode == 'geometric':
                     ts, ts_mjd, ts_sod, az, alt, r, tof1 = cpf_interp_azalt(
-                        ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, t_start_pass, t_end_pass, t_increment, mode, station, coord_type)
+                        cpf_data, t_start_pass, t_end_pass, t_increment, mode, station, coord_type, method=method, engine=engine, polar_motion=polar_motion, light_time_tolerance=light_time_tolerance)
                     predfile.write('{:^24s}  {:^5s}  {:^11s}  {:^9s}  {:^9s}  {:^13s}  {:^12s}\n'.format(
                         'UTC', 'MJD', 'SOD', 'Az[deg]', 'Alt[deg]', 'Distance[m]', 'TOF[s]'))
                     for i in range(len(ts)):
@@ -210,7 +329,7 @@ class CPF(object):
 
                 elif mode == 'apparent':
                     ts, ts_mjd, ts_sod, az_trans, alt_trans, delta_az, delta_alt, r_trans, tof2 = cpf_interp_azalt(
-                        ts_utc_cpf, ts_mjd_cpf, ts_sod_cpf, leap_second_cpf, positions_cpf, t_start_pass, t_end_pass, t_increment, mode, station, coord_type)
+                        cpf_data, t_start_pass, t_end_pass, t_increment, mode, station, coord_type, method=method, engine=engine, polar_motion=polar_motion, light_time_tolerance=light_time_tolerance)
                     predfile.write('{:^24s}  {:^5s}  {:^11s}  {:^9s}  {:^9s}  {:^8s}  {:^8s}  {:^13s}  {:^12s}\n'.format(
                         'UTC', 'MJD', 'SOD', 'Az[deg]', 'Alt[deg]', 'dAz[deg]', 'dAlt[deg]', 'Distance[m]', 'TOF[s]'))
                     for i in range(len(ts)):
@@ -0,0 +1,82 @@
+import numpy as np
+
+from ..cpf.cpf_time import mjdsod2iso
+
+
+class CPFEphemeris(object):
+    """
+    class CPFEphemeris
+
+    Compact container for the parsed data of a single CPF ephemeris file, with the header information and the position records in contiguous arrays.
+
+    Attributes:
+        header -> [dictionary] header information, such as 'Target Name', 'Start', 'End', etc., as in the outputs of read_cpf
+        mjd -> [int32 array] MJD of the position records
+        sod -> [float64 array] Second of Day of the position records
+        leap_second -> [int32 array] leap second flag of the position records
+        positions -> [2d float64 array] target positions in cartesian coordinates in meters, with shape of (number of records, 3)
+        velocities -> [2d float64 array] target velocities in meters per second from the velocity records(type 20), with shape of (number of records, 3);
+        empty with shape of (0, 3) if the CPF ephemeris carries no velocity records
+
+    Properties:
+        ts_utc -> [str array] iso-formatted UTC of the position records, which is formatted on first access
+
+    For compatibility with the dictionary formerly returned by read_cpf, items can be accessed with the keys 'MJD', 'SoD', 'Leap_Second', 'positions[m]', 'velocities[m/s]', 'ts_utc' and the header keys.
+    """
+
+    __slots__ = ('header', 'mjd', 'sod', 'leap_second', 'positions', 'velocities', '_ts_utc')
+
+    # Keys of the former dictionary mapped to the attributes
+    ARRAY_KEYS = {'MJD': 'mjd', 'SoD': 'sod', 'Leap_Second': 'leap_second', 'positions[m]': 'positions', 'velocities[m/s]': 'velocities', 'ts_utc': 'ts_utc'}
+
+    def __init__(self, header, mjd=(), sod=(), leap_second=(), positions=None, velocities=None):
+
+        self.header = header
+        self.mjd = np.ascontiguousarray(mjd, dtype=np.int32)
+        self.sod = np.ascontiguousarray(sod, dtype=np.float64)
+        self.leap_second = np.ascontiguousarray(leap_second, dtype=np.int32)
+        if positions is None: positions = np.empty((0, 3))
+        self.positions = np.ascontiguousarray(positions, dtype=np.float64)
+        if velocities is None: velocities = np.empty((0, 3))
+        self.velocities = np.ascontiguousarray(velocities, dtype=np.float64)
+        self._ts_utc = None
+
+    def __repr__(self):
+
+        return 'instance of class CPFEphemeris for {:s} with {:d} records'.format(self.header.get('Target Name', 'unknown target'), len(self))
+
+    def __len__(self):
+
+        return len(self.mjd)
+
+    @property
+    def ts_utc(self):
+
+        if self._ts_utc is None:
+            self._ts_utc = mjdsod2iso(self.mjd, self.sod)
+        return self._ts_utc
+
+    def __getitem__(self, key):
+
+        if key in self.ARRAY_KEYS:
+            return getattr(self, self.ARRAY_KEYS[key])
+        return self.header[key]
+
+    def __contains__(self, key):
+
+        return key in self.ARRAY_KEYS or key in self.header
+
+    def keys(self):
+
+        return list(self.header.keys()) + list(self.ARRAY_KEYS.keys())
+
+    def get(self, key, default=None):
+
+        return self[key] if key in self else default
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the arrays in bytes, excluding the iso-formatted UTC strings.
+        """
+        return self.mjd.nbytes + self.sod.nbytes + self.leap_second.nbytes + self.positions.nbytes + self.velocities.nbytes
@@ -0,0 +1,218 @@
+from bisect import bisect_right
+from math import atan2, asin, degrees, sqrt, sin, cos
+
+import numpy as np
+
+from ..cpf.cpf_interpolate import station_geodetic
+from ..cpf.cpf_time import leap_seconds, leap_second_step
+
+
+class CPFTracker(object):
+    """
+    class CPFTracker
+
+    Low-latency evaluator of a CPF ephemeris at single epochs, such as for closed-loop tracking, bound to a station once at creation.
+    Each call runs in pure Python on floats: the window of 10 records is found by bisection, or reused from the previous call,
+    and the interpolating polynomial of the window, whose coefficients are solved once per window and cached, is evaluated by Horner's scheme.
+    The topocentric coordinates are geometric, that is, the vector from the station to the target in ITRF resolved in the local east, north and up directions,
+    without light time, aberration and refraction, the same as the native engine of cpf_interp_azalt without the polar motion correction.
+
+    Attributes:
+        header -> [dictionary] header information of the CPF ephemeris
+        mjd_ref -> [int] reference MJD; epochs are counted in quasi seconds(SoD + Leap Second) from its beginning
+        t_start -> [float] beginning of the interpolation range in quasi seconds from the reference MJD
+        t_end -> [float] end of the interpolation range in quasi seconds from the reference MJD
+        site_xyz -> [tuple of float] geocentric coordinates of station in meters w.r.t. ITRF
+        leap_mjd -> [int or None] MJD from which the leap second applies; None if no leap second is involved
+        leap_second -> [int] number of leap seconds from leap_mjd on
+    """
+
+    def __init__(self, ephemeris, station, coord_type='geodetic'):
+
+        mjd, sod = ephemeris.mjd, ephemeris.sod
+        if len(mjd) < 10:
+            raise ValueError('At least 10 position records are required for the interpolation')
+
+        self.header = ephemeris.header
+        self.mjd_ref = int(mjd[0])
+        # The leap seconds are taken from the table of TAI-UTC, the same as interp_epochs
+        ts_cpf = (mjd - self.mjd_ref)*86400.0 + sod + leap_seconds(mjd, self.mjd_ref)
+        self._ts_cpf = ts_cpf.tolist()
+        self._positions = ephemeris.positions
+        self.t_start, self.t_end = float(ts_cpf[4]), float(ts_cpf[-5])
+
+        self.leap_mjd, self.leap_second = leap_second_step(mjd, self.mjd_ref)
+
+        site_xyz, lon, lat = station_geodetic(station, coord_type)
+        self.site_xyz = tuple(site_xyz.tolist())
+        # Rows of the rotation from ITRF to the local east, north and up directions
+        self._enu = ((-sin(lon), cos(lon), 0.0),
+                     (-sin(lat)*cos(lon), -sin(lat)*sin(lon), cos(lat)),
+                     (cos(lat)*cos(lon), cos(lat)*sin(lon), sin(lat)))
+
+        self._windows = {}
+        self._window = (float('inf'), float('-inf'), 0.0, 1.0, None)
+
+    def __repr__(self):
+
+        return 'instance of class CPFTracker for {:s}'.format(self.header.get('Target Name', 'unknown target'))
+
+    def quasi_seconds(self, mjd, sod):
+        """
+        Convert an epoch given by MJD and Second of Day in UTC to quasi seconds from the reference MJD, taking the leap second into account.
+        """
+        t = (mjd - self.mjd_ref)*86400.0 + sod
+        if self.leap_mjd is not None and mjd >= self.leap_mjd:
+            t += self.leap_second
+        return t
+
+    def _coefficients(self, t):
+        """
+        Find the window of an epoch in quasi seconds and return (lower bound, upper bound, center, inverse half-width, coefficients) of its polynomial,
+        where the coefficients are (cx, cy, cz) tuples from the highest degree down for Horner's scheme.
+        """
+        if not self.t_start <= t <= self.t_end:
+            raise ValueError('Epoch is outside the interpolation range of the CPF ephemeris')
+
+        ts_cpf = self._ts_cpf
+        start = min(max(bisect_right(ts_cpf, t) - 5, 0), len(ts_cpf) - 10)
+        self._window = self._window_at(start)
+        return self._window
+
+    def _window_at(self, start):
+        """
+        Return (lower bound, upper bound, center, inverse half-width, coefficients) of the polynomial of the window starting at a record, which is solved on first use and cached.
+        """
+        window = self._windows.get(start)
+        if window is None:
+            ts_cpf = self._ts_cpf
+            nodes = np.array(ts_cpf[start:start+10])
+            center, half = (nodes[0] + nodes[-1])/2, (nodes[-1] - nodes[0])/2
+            # Monomial coefficients in the local time scaled to [-1, 1] over the window
+            vandermonde = np.vander((nodes - center)/half, 10)
+            coefficients = np.linalg.solve(vandermonde, self._positions[start:start+10])
+            # The window serves the epochs from its 5th record to its 6th record, except at both ends of the CPF ephemeris
+            lower = ts_cpf[start+4] if start > 0 else float('-inf')
+            upper = ts_cpf[start+5] if start < len(ts_cpf) - 10 else float('inf')
+            window = (lower, upper, float(center), float(1/half), tuple(map(tuple, coefficients.tolist())))
+            self._windows[start] = window
+        return window
+
+    def position_quasi(self, t):
+        """
+        Evaluate the position at an epoch given in quasi seconds from the reference MJD.
+
+        Usage:
+            x,y,z = tracker.position_quasi(t)
+
+        Inputs:
+            t -> [float] epoch in quasi seconds from the reference MJD
+
+        Outputs:
+            x,y,z -> [float] target position in cartesian coordinates in meters w.r.t. ITRF
+        """
+        lower, upper, center, scale, coefficients = self._window
+        if not lower <= t < upper:
+            lower, upper, center, scale, coefficients = self._coefficients(t)
+        elif not self.t_start <= t <= self.t_end:
+            raise ValueError('Epoch is outside the interpolation range of the CPF ephemeris')
+
+        s = (t - center)*scale
+        x = y = z = 0.0
+        for cx, cy, cz in coefficients:
+            x = x*s + cx
+            y = y*s + cy
+            z = z*s + cz
+        return x, y, z
+
+    def position(self, mjd, sod):
+        """
+        Evaluate the position at an epoch given by MJD and Second of Day in UTC.
+
+        Usage:
+            x,y,z = tracker.position(57754,3600.5)
+
+        Inputs:
+            mjd -> [int] MJD
+            sod -> [float] Second of Day
+
+        Outputs:
+            x,y,z -> [float] target position in cartesian coordinates in meters w.r.t. ITRF
+        """
+        return self.position_quasi(self.quasi_seconds(mjd, sod))
+
+    def azalt(self, mjd, sod):
+        """
+        Evaluate the azimuth, altitude and range of the target w.r.t. the station at an epoch given by MJD and Second of Day in UTC.
+
+        Usage:
+            az,alt,r = tracker.azalt(57754,3600.5)
+
+        Inputs:
+            mjd -> [int] MJD
+            sod -> [float] Second of Day
+
+        Outputs:
+            az -> [float] Azimuth in degrees
+            alt -> [float] Altitude in degrees
+            r -> [float] Range in meters
+        """
+        x, y, z = self.position_quasi(self.quasi_seconds(mjd, sod))
+        sx, sy, sz = self.site_xyz
+        dx, dy, dz = x - sx, y - sy, z - sz
+        (ex, ey, ez), (nx, ny, nz), (ux, uy, uz) = self._enu
+        e = ex*dx + ey*dy + ez*dz
+        n = nx*dx + ny*dy + nz*dz
+        up = ux*dx + uy*dy + uz*dz
+        r = sqrt(dx*dx + dy*dy + dz*dz)
+        return degrees(atan2(e, n)) % 360, degrees(asin(up/r)), r
+
+    def stream(self, epochs):
+        """
+        Evaluate the position and range of the target for a stream of epochs in non-decreasing order, such as epochs generated in real time by a kHz laser system.
+        The current window is kept while the epochs stay in it, and is advanced record by record when a node boundary is crossed,
+        so the cost per epoch is amortized O(1) without any search.
+
+        Usage:
+            for x,y,z,r in tracker.stream(epochs):
+                ...
+
+        Inputs:
+            epochs -> [iterable of (int, float)] epochs given by MJD and Second of Day in UTC in non-decreasing order; it may be a generator of unlimited length
+
+        Outputs:
+            generator of (x, y, z, r), where
+            x,y,z -> [float] target position in cartesian coordinates in meters w.r.t. ITRF
+            r -> [float] range from the station to the target in meters
+        """
+        ts_cpf = self._ts_cpf
+        last = len(ts_cpf) - 10
+        t_start, t_end = self.t_start, self.t_end
+        sx, sy, sz = self.site_xyz
+        start = None
+        lower = upper = float('-inf')
+
+        for mjd, sod in epochs:
+            t = self.quasi_seconds(mjd, sod)
+            if not lower <= t < upper:
+                if not t_start <= t <= t_end:
+                    raise ValueError('Epoch is outside the interpolation range of the CPF ephemeris')
+                if start is None:
+                    start = min(max(bisect_right(ts_cpf, t) - 5, 0), last)
+                elif t < lower:
+                    raise ValueError('Epochs must be in non-decreasing order')
+                else:
+                    while start < last and t >= ts_cpf[start+5]:
+                        start += 1
+                lower, upper, center, scale, coefficients = self._window_at(start)
+            elif t > t_end:
+                raise ValueError('Epoch is outside the interpolation range of the CPF ephemeris')
+
+            s = (t - center)*scale
+            x = y = z = 0.0
+            for cx, cy, cz in coefficients:
+                x = x*s + cx
+                y = y*s + cy
+                z = z*s + cz
+            dx, dy, dz = x - sx, y - sy, z - sz
+            yield x, y, z, sqrt(dx*dx + dy*dy + dz*dz)
@@ -0,0 +1,155 @@
+import numpy as np
+import erfa
+
+
+class EarthOrientation(object):
+    """
+    class EarthOrientation
+
+    Provider of the rotation matrices from ITRF to GCRF, following the CIO-based transformation used by astropy,
+    that is, the product of the transposed celestial-to-intermediate matrix(precession-nutation), the rotation by the Earth rotation angle and the transposed polar motion matrix.
+    The precession-nutation matrix, the polar motion matrix and UT1-TT vary slowly, so they are computed on a coarse grid of nodes in TT and interpolated linearly,
+    while the Earth rotation angle is evaluated at every epoch. The nodes are cached and extended as later epochs require.
+    Whenever nodes are computed, the interpolation is checked at the midpoints between them, and the node spacing is halved until the deviation is within the tolerance.
+
+    Attributes:
+        step -> [float] spacing of the nodes in seconds
+        tolerance -> [float] tolerance of the interpolated rotation matrices, as the largest deviation of their elements, which is about an angle in radians
+        max_error -> [float] largest deviation found at the midpoints of the computed nodes, in radians
+    """
+
+    def __init__(self, step=3600, tolerance=1e-10):
+
+        self.step = float(step)
+        self.tolerance = float(tolerance)
+        self.max_error = 0.0
+        self.clear()
+
+    def __repr__(self):
+
+        return 'instance of class EarthOrientation with {:d} cached nodes in steps of {:g} seconds, max error {:.1e} rad'.format(len(self._dut), self.step, self.max_error)
+
+    def clear(self):
+        """
+        Clear the cached nodes.
+        """
+        self._k_start = 0
+        self._ct, self._wt, self._dut = np.empty((0, 3, 3)), np.empty((0, 3, 3)), np.empty(0)
+
+    def exact(self, jd1, jd2):
+        """
+        Compute the slowly varying parts of the rotation at epochs given by two-part Julian dates in TT.
+
+        Usage:
+            ct, wt, dut = eo.exact(jd1, jd2)
+
+        Inputs:
+            jd1 -> [float array] first part of the Julian dates in TT
+            jd2 -> [float array] second part of the Julian dates in TT
+
+        Outputs:
+            ct -> [3d float array] transposed celestial-to-intermediate matrices
+            wt -> [3d float array] transposed polar motion matrices
+            dut -> [float array] UT1-TT in seconds
+        """
+        from astropy.time import Time
+        from astropy.utils import iers
+
+        ts = Time(jd1, jd2, format='jd', scale='tt')
+        xp, yp = iers.earth_orientation_table.get().pm_xy(ts)
+        w = erfa.pom00(xp.to_value('rad'), yp.to_value('rad'), erfa.sp00(jd1, jd2))
+        ut1 = ts.ut1
+        dut = ((ut1.jd1 - jd1) + (ut1.jd2 - jd2))*86400
+        return erfa.c2i06a(jd1, jd2).transpose(0, 2, 1), w.transpose(0, 2, 1), dut
+
+    def nodes(self, k_start, k_end):
+        """
+        Make sure the nodes with indices from k_start to k_end, counted in steps from J2000.0(TT), are cached; the node spacing is halved if the tolerance is not met.
+        """
+        while True:
+            cached_end = self._k_start + len(self._dut)
+            if len(self._dut) and k_start >= self._k_start and k_end < cached_end: return
+            if len(self._dut) and k_start <= cached_end and k_end >= self._k_start - 1:
+                # Extend the cached nodes on either side
+                k_new = np.r_[np.arange(k_start, self._k_start), np.arange(cached_end, k_end + 1)]
+            else:
+                self.clear()
+                k_new = np.arange(k_start, k_end + 1)
+                self._k_start = k_start
+
+            # The nodes and the midpoints after them are computed together for the check of the interpolation
+            k_eval = np.r_[k_new, k_new + 0.5]
+            ct, wt, dut = self.exact(np.full(len(k_eval), 2451545.0), k_eval*self.step/86400)
+            n = len(k_new)
+            before = k_new < self._k_start
+            self._ct = np.concatenate((ct[:n][before], self._ct, ct[:n][~before]))
+            self._wt = np.concatenate((wt[:n][before], self._wt, wt[:n][~before]))
+            self._dut = np.concatenate((dut[:n][before], self._dut, dut[:n][~before]))
+            self._k_start = min(self._k_start, k_start)
+
+            inside = k_new + 1 < self._k_start + len(self._dut)
+            mid = self.interpolate((k_new[inside] + 0.5)*self.step)
+            # UT1-TT enters the Earth rotation angle, at the rotation rate of the Earth
+            error = max(np.abs(mid[0] - ct[n:][inside]).max(initial=0), np.abs(mid[1] - wt[n:][inside]).max(initial=0),
+                        7.292115146706979e-5*np.abs(mid[2] - dut[n:][inside]).max(initial=0))
+            if error <= self.tolerance:
+                self.max_error = max(self.max_error, error)
+                return
+            self.step /= 2
+            self.clear()
+            k_start, k_end = 2*k_start, 2*k_end + 1
+
+    def interpolate(self, t):
+        """
+        Interpolate the cached nodes linearly at epochs given in TT seconds from J2000.0.
+        """
+        x = t/self.step - self._k_start
+        index = np.clip(np.floor(x).astype(int), 0, len(self._dut) - 2)
+        frac = x - index
+        ct = self._ct[index] + frac[:, None, None]*(self._ct[index+1] - self._ct[index])
+        wt = self._wt[index] + frac[:, None, None]*(self._wt[index+1] - self._wt[index])
+        dut = self._dut[index] + frac*(self._dut[index+1] - self._dut[index])
+        return ct, wt, dut
+
+    def rotation(self, ts):
+        """
+        Calculate the rotation matrices from ITRF to GCRF.
+
+        Usage:
+            rotation = eo.rotation(ts)
+
+        Inputs:
+            ts -> [object of class Astropy Time] epochs
+
+        Outputs:
+            rotation -> [3d float array] rotation matrices with shape of (number of epochs, 3, 3), such that positions_gcrf = rotation @ positions_itrf
+        """
+        tt = ts.tt.ravel()
+        jd1, jd2 = tt.jd1, tt.jd2
+        t = ((jd1 - 2451545.0) + jd2)*86400
+        self.nodes(int(np.floor(t.min()/self.step)), int(np.floor(t.max()/self.step)) + 1)
+        # The node spacing may have been refined by the check
+        ct, wt, dut = self.interpolate(t)
+
+        era = erfa.era00(jd1, jd2 + dut/86400)
+        cos_era, sin_era = np.cos(era), np.sin(era)
+        r3t = np.zeros((len(era), 3, 3))
+        r3t[:, 0, 0], r3t[:, 0, 1], r3t[:, 1, 0], r3t[:, 1, 1], r3t[:, 2, 2] = cos_era, -sin_era, sin_era, cos_era, 1
+        return ct @ r3t @ wt
+
+    def compare(self, ts):
+        """
+        Compare the rotation matrices with those of the full transformation of astropy.
+
+        Usage:
+            error = eo.compare(ts)
+
+        Inputs:
+            ts -> [object of class Astropy Time] epochs
+
+        Outputs:
+            error -> [float array] largest deviation of the elements of the rotation matrices at each epoch, which is about an angle in radians
+        """
+        from ..cpf.cpf_interpolate import itrs2gcrf_rotation
+
+        return np.abs(self.rotation(ts) - itrs2gcrf_rotation(ts, engine='astropy')).max(axis=(1, 2))
@@ -0,0 +1,158 @@
+import numpy as np
+import erfa
+
+from ..cpf.cpf_time import iso2mjdsod, day_length, normalize_mjdsod, mjdsod2iso, mjdsod2ns, mjd2date
+
+
+class TimeGrid(object):
+    """
+    class TimeGrid
+
+    Lightweight grid of equally spaced UTC epochs, held as the starting MJD and Second of Day, the time step and the number of epochs.
+    The epochs are only materialized on request, as MJD and Second of Day, integer nanoseconds or iso-formatted strings, for the whole grid,
+    for selected indices or chunk by chunk; an Astropy Time object is only built where the frame transformations need it.
+    The time step is counted in SI seconds, so a leap second inserted within the grid is one step of one second, as with the TimeDelta of astropy.
+
+    Attributes:
+        mjd_start -> [int] MJD of the first epoch
+        sod_start -> [float] Second of Day of the first epoch
+        step -> [float] time step in seconds
+        size -> [int] number of epochs
+    """
+
+    def __init__(self, mjd_start, sod_start, step, size):
+
+        self.mjd_start = int(mjd_start)
+        self.sod_start = float(sod_start)
+        self.step = float(step)
+        self.size = int(size)
+
+    def __repr__(self):
+
+        first, last = self.isot([0, self.size - 1]) if self.size else ('', '')
+        return 'instance of class TimeGrid with {:d} epochs from {:s} to {:s} in steps of {:g} seconds'.format(self.size, first, last, self.step)
+
+    def __len__(self):
+
+        return self.size
+
+    def from_range(t_start, t_end, step):
+        """
+        Generate the grid from the start time, end time, and time step, with the same epochs as t_list.
+
+        Usage:
+            grid = TimeGrid.from_range('2017-01-01 00:00:00','2017-01-02 00:00:00',0.1)
+
+        Inputs:
+            t_start -> [str or object of class Astropy Time] starting date and time
+            t_end -> [str or object of class Astropy Time] ending date and time
+            step -> [float] time step in seconds
+
+        Outputs:
+            grid -> [object] instance of class TimeGrid
+        """
+        mjd_start, sod_start = iso2mjdsod(t_start)
+        mjd_end, sod_end = iso2mjdsod(t_end)
+        duration = np.around(np.sum(day_length(np.arange(mjd_start, mjd_end))) + sod_end - sod_start)
+        # The number of epochs of np.arange(0, duration+step, step)
+        size = max(0, int(np.ceil((duration + step)/step)))
+        return TimeGrid(mjd_start, sod_start, step, size)
+
+    def indices(self, index=None):
+        """
+        Normalize the selection of epochs to an int array of indices; None selects the whole grid.
+        """
+        if index is None:
+            return np.arange(self.size)
+        return np.arange(*index.indices(self.size)) if isinstance(index, slice) else np.asarray(index, dtype=np.int64)
+
+    def mjdsod(self, index=None):
+        """
+        Materialize the epochs as MJD and Second of Day in UTC.
+
+        Usage:
+            ts_mjd,ts_sod = grid.mjdsod()
+            ts_mjd,ts_sod = grid.mjdsod([0,10,20])
+
+        Parameters:
+            index -> [int array or slice, default = None] indices of the epochs; None for the whole grid
+
+        Outputs:
+            ts_mjd -> [int array] MJD
+            ts_sod -> [float array] Second of Day
+        """
+        return normalize_mjdsod(self.mjd_start, self.sod_start + self.indices(index)*self.step)
+
+    def ns(self, mjd_ref=None, leap_second=0, index=None):
+        """
+        Materialize the epochs as integer nanoseconds from the beginning of a reference MJD; see mjdsod2ns.
+
+        Usage:
+            ts_ns = grid.ns()
+            ts_ns = grid.ns(mjd_ref,leap_second)
+
+        Parameters:
+            mjd_ref -> [int, default = None] reference MJD; None for the MJD of the first epoch
+            leap_second -> [int array, default = 0] leap second flag of the epochs
+            index -> [int array or slice, default = None] indices of the epochs; None for the whole grid
+
+        Outputs:
+            ts_ns -> [int64 array] nanoseconds from the beginning of the reference MJD
+        """
+        ts_mjd, ts_sod = self.mjdsod(index)
+        return mjdsod2ns(ts_mjd, ts_sod, leap_second, self.mjd_start if mjd_ref is None else mjd_ref)
+
+    def isot(self, index=None):
+        """
+        Format the epochs as isot-formatted UTC with millisecond precision, such as '2017-01-01T00:00:00.000'.
+        """
+        return mjdsod2iso(*self.mjdsod(index), sep='T')
+
+    def to_time(self, index=None):
+        """
+        Convert the epochs to an Astropy Time object in UTC, for the frame transformations.
+
+        Usage:
+            ts = grid.to_time()
+            ts = grid.to_time(slice(0,1000))
+
+        Parameters:
+            index -> [int array or slice, default = None] indices of the epochs; None for the whole grid
+
+        Outputs:
+            ts -> [object of class Astropy Time] epochs in UTC
+        """
+        from astropy.time import Time
+
+        ts_mjd, ts_sod = self.mjdsod(index)
+        year, month, day = mjd2date(ts_mjd)
+        # The leap second(23:59:60) stays in the last minute of the day
+        hour = np.minimum(ts_sod//3600, 23)
+        minute = np.minimum((ts_sod - hour*3600)//60, 59)
+        second = ts_sod - hour*3600 - minute*60
+        jd1, jd2 = erfa.dtf2d(b'UTC', year, month, day, hour.astype(int), minute.astype(int), second)
+        return Time(jd1, jd2, format='jd', scale='utc')
+
+    def chunks(self, chunk_size):
+        """
+        Split the grid into consecutive sub-grids of at most chunk_size epochs.
+
+        Usage:
+            for chunk in grid.chunks(86400):
+                ts_mjd,ts_sod = chunk.mjdsod()
+
+        Inputs:
+            chunk_size -> [int] maximum number of epochs in each sub-grid
+
+        Outputs:
+            generator of instances of class TimeGrid
+        """
+        for k in range(0, self.size, chunk_size):
+            yield self.subgrid(k, min(k + chunk_size, self.size))
+
+    def subgrid(self, start, stop):
+        """
+        Sub-grid of the epochs with indices from start up to, but excluding, stop.
+        """
+        mjd, sod = normalize_mjdsod(self.mjd_start, self.sod_start + start*self.step)
+        return TimeGrid(mjd[0], sod[0], self.step, max(0, stop - start))